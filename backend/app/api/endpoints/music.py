@@ -1,11 +1,20 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Body
 from pydantic import BaseModel
-from app.services.auth_service import verify_token
-from app.services.spotify_service import SpotifyService
-from app.services.scoring_service import ScoringService
-from app.schemas.music import MusicData
+from app.services.auth_service import user_id_of, verify_token
+from app.services.spotify_service import SpotifyService, SpotifyUnavailable
+from app.services.scoring_service import IncrementalScorer, ScoringService
+from app.services.spotify_snapshots import score_profile
+from app.core.singleflight import SingleFlight, token_hash
+from app.core.tracing import TimedRoute, span
+from app.schemas.music import ExtendedMusicData, MusicData
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
+
+_analyze_flight = SingleFlight("music_analyze")
+_extended_flight = SingleFlight("music_analyze_extended")
 
 class AnalyzeRequest(BaseModel):
     spotify_access_token: str
@@ -24,28 +33,64 @@ async def analyze_music(
     if not spotify_token:
         raise HTTPException(status_code=400, detail="Missing Spotify Access Token")
         
+    try:
+        return await _analyze_flight.do(
+            (user_id_of(current_user), token_hash(spotify_token)), lambda: run_analysis(spotify_token)
+        )
+    except SpotifyUnavailable as e:
+        logger.warning("Spotify unavailable", extra={"error": str(e)})
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except Exception as e:
+        logger.exception("Music analysis failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def run_analysis(spotify_token: str) -> MusicData:
     service = SpotifyService(spotify_token)
     scorer = ScoringService()
-    
+
+    # 1. Fetch Data concurrently (recent tracks are optional)
+    profile = await service.fetch_profile(limit=20)
+
+    # 2. Calculate Score
+    with span("scoring"):
+        music_data = score_profile(profile, scorer)
+
+    # 3. Add recent tracks (not used in score but needed for display)
+    music_data.recent_tracks = profile.recent_tracks
+
+    # Nothing is saved here; roasts are persisted by the write-behind writer (app/services/roast_store.py)
+    return music_data
+
+
+@router.post("/analyze/extended", response_model=ExtendedMusicData)
+async def analyze_music_extended(
+    request: AnalyzeRequest,
+    current_user: dict = Depends(verify_token)
+):
+    """
+    Scores short-, medium- and long-term listening separately (up to 99 top artists and
+    tracks each) and reports how taste drifted between them.
+    """
+    spotify_token = request.spotify_access_token
+    if not spotify_token:
+        raise HTTPException(status_code=400, detail="Missing Spotify Access Token")
+
     try:
-        # 1. Fetch Data concurrently (in a real app, gather these)
-        top_artists = await service.get_top_artists(limit=20)
-        top_tracks = await service.get_top_tracks(limit=20)
-        recent_tracks = await service.get_recent_tracks(limit=20)
-        
-        # 2. Calculate Score
-        music_data = scorer.calculate_score(top_artists, top_tracks)
-        
-        # 3. Add recent tracks (not used in score but needed for display)
-        music_data.recent_tracks = recent_tracks
-        
-        # 4. Save to Database (TODO: Implement Database saving logic later)
-        # We'll do this when we implement the "Roast" persistence layer
-        
-        return music_data
-        
+        return await _extended_flight.do(
+            (user_id_of(current_user), token_hash(spotify_token)), lambda: run_extended_analysis(spotify_token)
+        )
+    except SpotifyUnavailable as e:
+        logger.warning("Spotify unavailable", extra={"error": str(e)})
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": e.retry_after_header})
     except Exception as e:
-        print(f"Error during analysis: {e}")
+        logger.exception("Extended music analysis failed")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await service.close()
+
+
+async def run_extended_analysis(spotify_token: str) -> ExtendedMusicData:
+    scorer = IncrementalScorer()
+    # Pages are scored as they arrive; only the final ranking and the drift are left after the fetch
+    await SpotifyService(spotify_token).fetch_extended_profile(scorer)
+    with span("scoring"):
+        return scorer.result()
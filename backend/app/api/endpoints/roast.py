@@ -1,18 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from app.services.auth_service import verify_token
-from app.services.spotify_service import SpotifyService
-from app.services.scoring_service import ScoringService
-from app.services.gemini_service import GeminiService
+import asyncio
+import json
+import logging
+import math
+import os
+from datetime import datetime
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+import httpx
+from pydantic import BaseModel, Field, PlainSerializer
+from app.core.deadline import DeadlineExceeded, deadline_scope
+from app.core.singleflight import SingleFlight, token_hash
+from app.core.tracing import TimedRoute, span
+from app.schemas.music import GroupComparison, MusicData
+from app.services.auth_service import user_id_of, verify_token
+from app.services.spotify_service import SpotifyService, SpotifyUnavailable
+from app.services.scoring_service import IncrementalScorer, ScoringService, compare_group
+from app.services.spotify_snapshots import score_profile
+from app.services.gemini_service import get_gemini_service
+from app.services.roast_jobs import QueueFull, RoastJob, RoastJobQueue
+from app.services.roast_store import get_roast_writer, save_roast
 
+logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# Double clicks / retries from the same user and Spotify session share one pipeline run
+_generate_flight = SingleFlight("roast_generate")
 
 class GenerateRoastRequest(BaseModel):
     spotify_access_token: str
+    bypass_cache: bool = False # force a fresh LLM roast
+
+# Roast ids use 63 bits, more than a JavaScript number holds exactly, so JSON carries them as strings
+RoastId = Annotated[int, PlainSerializer(str, return_type=str, when_used="json")]
 
 class RoastResponse(BaseModel):
-    id: int | None = None
+    id: RoastId | None = None
+    share_token: str | None = None # for GET /shared/{share_token} links
     roast_text: str
     persona: str
     era: dict | None = None
@@ -20,6 +45,31 @@ class RoastResponse(BaseModel):
     taste_score: int
     roast_traits: list[str]
     music_data: dict # simplified snapshot
+    source: str = "llm" # "llm", "cache", "template" (LLM failed or too slow) or "llm_partial" (streams only)
+
+def music_snapshot(music_data: MusicData) -> dict:
+    return {
+        "top_artists": [a.model_dump() for a in music_data.top_artists[:5]],
+        "top_tracks": [t.model_dump() for t in music_data.top_tracks[:5]],
+        "genres": music_data.dominating_genres
+    }
+
+def build_roast_response(music_data: MusicData, ai_result: dict) -> RoastResponse:
+    """Combines the scored music data and the LLM output into the API response."""
+    return RoastResponse(
+        id=None,
+        roast_text=ai_result.get("roast", "Roast failed"),
+        persona=ai_result.get("persona", "Basic Music Consumer"),
+        era=ai_result.get("era"),
+        hogwarts_house=ai_result.get("hogwarts_house"),
+        taste_score=music_data.taste_score,
+        roast_traits=music_data.roast_traits,
+        music_data=music_snapshot(music_data),
+        source=ai_result.get("source", "llm"),
+    )
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @router.post("/generate", response_model=RoastResponse)
 async def generate_roast_endpoint(
@@ -33,44 +83,383 @@ async def generate_roast_endpoint(
     if not request.spotify_access_token:
         raise HTTPException(status_code=400, detail="Missing Spotify Token")
 
-    # 1. Pipeline execution
+    key = (user_id_of(current_user), token_hash(request.spotify_access_token), request.bypass_cache)
+    try:
+        return await _generate_flight.do(
+            key, lambda: run_roast_pipeline(request.spotify_access_token, request.bypass_cache, user_id=key[0])
+        )
+    except SpotifyUnavailable as e:
+        logger.warning("Spotify unavailable", extra={"error": str(e)})
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except DeadlineExceeded as e:
+        logger.warning("Roast deadline passed before Spotify answered")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.exception("Roast generation failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def run_roast_pipeline(
+    spotify_access_token: str,
+    bypass_cache: bool = False,
+    deadline_seconds: float | None = None,
+    user_id: str | None = None,
+) -> RoastResponse:
+    """
+    Fetch -> score -> roast within `deadline_seconds` (ROAST_DEADLINE_SECONDS by default);
+    a late LLM is replaced by the template roast. With a user_id the roast is queued for
+    saving (when persistence is on) and the response carries its id and share token.
+    """
+    with deadline_scope(deadline_seconds):
+        roast = await _roast_pipeline(spotify_access_token, bypass_cache)
+    if user_id is not None:
+        roast.id, roast.share_token = save_roast(user_id, roast.model_dump()) or (None, None)
+    return roast
+
+
+async def _roast_pipeline(spotify_access_token: str, bypass_cache: bool) -> RoastResponse:
+    spotify = SpotifyService(spotify_access_token)
+    scorer = ScoringService()
+    gemini = get_gemini_service()
+
+    # Fetch (concurrently)
+    profile = await spotify.fetch_profile(include_recent=False)
+
+    # Score
+    with span("scoring"):
+        music_data = score_profile(profile, scorer)
+
+    # Roast (Returns Dict with 'roast' and 'persona')
+    ai_result = await gemini.generate_roast(music_data, use_cache=not bypass_cache)
+
+    return build_roast_response(music_data, ai_result)
+
+
+@router.post("/stream")
+async def stream_roast_endpoint(
+    request: GenerateRoastRequest,
+    current_user: dict = Depends(verify_token)
+):
+    """
+    Same pipeline as /generate, streamed as Server-Sent Events:
+    - `score`: taste score, traits and the music snapshot, as soon as scoring is done
+    - `token`: pieces of the roast text as Gemini produces them
+    - `result`: the final payload, identical in shape to RoastResponse
+    - `error`: sent instead of `result` if the pipeline fails mid-stream
+    """
+    if not request.spotify_access_token:
+        raise HTTPException(status_code=400, detail="Missing Spotify Token")
+
     spotify = SpotifyService(request.spotify_access_token)
     scorer = ScoringService()
-    gemini = GeminiService()
-    
+    gemini = get_gemini_service()
+
+    # Spotify + scoring run before the stream opens so failures still get a proper status code
     try:
-        # Fetch
-        top_artists = await spotify.get_top_artists()
-        top_tracks = await spotify.get_top_tracks()
-        
-        # Score
-        music_data = scorer.calculate_score(top_artists, top_tracks)
-        
-        # Roast (Returns Dict with 'roast' and 'persona')
-        ai_result = await gemini.generate_roast(music_data)
-        
-        # Build response snapshot
-        snapshot = {
-            "top_artists": [a.model_dump() for a in music_data.top_artists[:5]],
-            "top_tracks": [t.model_dump() for t in music_data.top_tracks[:5]],
-            "genres": music_data.dominating_genres
-        }
-        
-        # No DB - just return response
-        return RoastResponse(
-            id=None,
-            roast_text=ai_result.get("roast", "Roast failed"),
-            persona=ai_result.get("persona", "Basic Music Consumer"),
-            era=ai_result.get("era"),
-            hogwarts_house=ai_result.get("hogwarts_house"),
-            taste_score=music_data.taste_score,
-            roast_traits=music_data.roast_traits,
-            music_data=snapshot
+        with deadline_scope() as deadline:
+            profile = await spotify.fetch_profile(include_recent=False)
+        with span("scoring"):
+            music_data = score_profile(profile, scorer)
+        if music_data is None:
+            raise ValueError("Not enough listening history to roast")
+    except SpotifyUnavailable as e:
+        logger.warning("Spotify unavailable", extra={"error": str(e)})
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except DeadlineExceeded as e:
+        logger.warning("Roast deadline passed before Spotify answered")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.exception("Roast generation failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        yield _sse("score", {
+            "taste_score": music_data.taste_score,
+            "roast_traits": music_data.roast_traits,
+            "musical_era": music_data.musical_era,
+            "music_data": music_snapshot(music_data),
+        })
+        try:
+            async for kind, payload in gemini.stream_roast(music_data, use_cache=not request.bypass_cache, deadline=deadline):
+                if kind == "token":
+                    yield _sse("token", {"text": payload})
+                else:
+                    roast = build_roast_response(music_data, payload)
+                    roast.id, roast.share_token = save_roast(user_id_of(current_user), roast.model_dump()) or (None, None)
+                    yield _sse("result", roast.model_dump(mode="json"))
+        except Exception as e:
+            logger.exception("Roast streaming failed")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Job mode: POST /jobs answers right away, a worker pool runs the pipeline, GET polls ---
+
+# Nobody is holding a connection open for a job, so it can wait longer for the LLM
+ROAST_JOB_DEADLINE_SECONDS = float(os.getenv("ROAST_JOB_DEADLINE_SECONDS", "60"))
+
+
+class RoastJobResponse(BaseModel):
+    job_id: str
+    status: str # queued, running, done or failed
+    result: RoastResponse | None = None
+    error: str | None = None
+
+
+def _job_response(job: RoastJob) -> RoastJobResponse:
+    return RoastJobResponse(job_id=job.id, status=job.status, result=job.result, error=job.error)
+
+
+async def _run_roast_job(payload: dict) -> dict:
+    roast = await run_roast_pipeline(
+        payload["spotify_access_token"], payload["bypass_cache"],
+        deadline_seconds=ROAST_JOB_DEADLINE_SECONDS, user_id=payload["user_id"],
+    )
+    return roast.model_dump()
+
+
+# Started and stopped by the app lifespan
+job_queue = RoastJobQueue(_run_roast_job)
+
+
+@router.post("/jobs", response_model=RoastJobResponse, status_code=202)
+async def submit_roast_job(
+    request: GenerateRoastRequest,
+    http_request: Request,
+    response: Response,
+    current_user: dict = Depends(verify_token)
+):
+    """
+    Queues the /generate pipeline and returns a job id immediately.
+    Poll GET /jobs/{job_id} (optionally with ?wait=<seconds> to long-poll) for the result.
+    Resubmitting while the same roast is still pending returns the existing job.
+    """
+    if not request.spotify_access_token:
+        raise HTTPException(status_code=400, detail="Missing Spotify Token")
+
+    user_id = user_id_of(current_user)
+    try:
+        job = await job_queue.submit(
+            user_id,
+            {"spotify_access_token": request.spotify_access_token, "bypass_cache": request.bypass_cache, "user_id": user_id},
+            dedupe_key=(user_id, token_hash(request.spotify_access_token), request.bypass_cache),
         )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    response.headers["Location"] = str(http_request.url_for("get_roast_job", job_id=job.id))
+    return _job_response(job)
+
 
-        
+@router.get("/jobs/{job_id}", response_model=RoastJobResponse)
+async def get_roast_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the job to finish"),
+    current_user: dict = Depends(verify_token)
+):
+    job = await job_queue.get(job_id, wait=wait)
+    if job is None or job.user_id != user_id_of(current_user):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+
+# --- Group roasts: a group of friends fetched, compared and roasted in one request ---
+
+GROUP_ROAST_MAX_MEMBERS = int(os.getenv("GROUP_ROAST_MAX_MEMBERS", "10"))
+# Spotify profiles fetched at the same time for one group
+GROUP_ROAST_CONCURRENCY = int(os.getenv("GROUP_ROAST_CONCURRENCY", "4"))
+GROUP_ROAST_DEADLINE_SECONDS = float(os.getenv("GROUP_ROAST_DEADLINE_SECONDS", "15"))
+
+
+class GroupMember(BaseModel):
+    spotify_access_token: str
+    name: str | None = Field(None, max_length=40) # used in the group roast; defaults to "Member <n>"
+
+
+class GroupRoastRequest(BaseModel):
+    members: list[GroupMember] = Field(min_length=2, max_length=GROUP_ROAST_MAX_MEMBERS)
+    bypass_cache: bool = False
+
+
+class GroupMemberResult(BaseModel):
+    name: str
+    status: str # "ok" or "failed"
+    roast: RoastResponse | None = None
+    error: str | None = None
+
+
+class GroupRoast(BaseModel):
+    title: str
+    roast_text: str
+    source: str = "llm" # "llm", "cache" or "template"
+
+
+class GroupRoastResponse(BaseModel):
+    members: list[GroupMemberResult] # in request order
+    group: GroupRoast | None = None # needs at least two members that could be scored
+    comparison: GroupComparison | None = None
+    failed: int = 0
+
+
+def _member_names(members: list[GroupMember]) -> list[str]:
+    """Display names, unique within the group (they key the scorer and the LLM answer)."""
+    names = []
+    for i, member in enumerate(members, 1):
+        base = (member.name or "").strip() or f"Member {i}"
+        name, n = base, 2
+        while name in names:
+            name, n = f"{base} ({n})", n + 1
+        names.append(name)
+    return names
+
+
+def _member_error(error: BaseException) -> str:
+    if isinstance(error, SpotifyUnavailable):
+        return f"Spotify unavailable: {error}"
+    if isinstance(error, DeadlineExceeded):
+        return "Timed out fetching the Spotify profile"
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 401:
+        return "Spotify token expired or invalid"
+    return "Spotify profile could not be fetched"
+
+
+async def run_group_roast(
+    members: list[GroupMember], bypass_cache: bool = False, deadline_seconds: float | None = None
+) -> GroupRoastResponse:
+    """
+    Fetches every member's profile (GROUP_ROAST_CONCURRENCY at a time; a token listed twice
+    is fetched once), scores all of them in one IncrementalScorer so the pairwise comparison
+    falls out of the same pass, then roasts members and group with packed LLM calls.
+    Members that fail are reported per member; the rest of the group is still roasted.
+    """
+    names = _member_names(members)
+    token_keys = [token_hash(m.spotify_access_token) for m in members]
+    tokens = dict(zip(token_keys, (m.spotify_access_token for m in members)))
+    semaphore = asyncio.Semaphore(GROUP_ROAST_CONCURRENCY)
+
+    async def fetch(token: str):
+        async with semaphore:
+            return await SpotifyService(token).fetch_profile(include_recent=False)
+
+    seconds = GROUP_ROAST_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+    with deadline_scope(seconds):
+        outcomes = await asyncio.gather(*(fetch(t) for t in tokens.values()), return_exceptions=True)
+        profiles = dict(zip(tokens, outcomes))
+
+        errors: dict[str, str] = {}
+        scorer = IncrementalScorer(time_ranges=names)
+        with span("scoring"):
+            for i, (name, key) in enumerate(zip(names, token_keys)):
+                profile = profiles[key]
+                if isinstance(profile, BaseException):
+                    logger.warning("Group member profile failed", extra={"member": i, "error": f"{type(profile).__name__}: {profile}"})
+                    errors[name] = _member_error(profile)
+                    continue
+                scorer.add_artists(name, 0, profile.top_artists)
+                scorer.add_tracks(name, 0, profile.top_tracks)
+            scored = {}
+            for name in names:
+                if name not in errors:
+                    music_data = scorer.score(name)
+                    if music_data is None:
+                        errors[name] = "Not enough listening history to roast"
+                    else:
+                        scored[name] = music_data
+            comparison = compare_group(scorer, scored) if len(scored) >= 2 else None
+
+        roasts, group = {}, None
+        if scored:
+            roasts, group = await get_gemini_service().generate_group_roast(scored, comparison, use_cache=not bypass_cache)
+
+    results = [
+        GroupMemberResult(name=name, status="ok", roast=build_roast_response(scored[name], roasts[name]))
+        if name in scored else GroupMemberResult(name=name, status="failed", error=errors[name])
+        for name in names
+    ]
+    return GroupRoastResponse(
+        members=results,
+        group=GroupRoast(title=group.get("title") or "The Group", roast_text=group["roast"], source=group["source"]) if group else None,
+        comparison=comparison,
+        failed=len(errors),
+    )
+
+
+@router.post("/group", response_model=GroupRoastResponse)
+async def group_roast_endpoint(
+    request: GroupRoastRequest,
+    current_user: dict = Depends(verify_token)
+):
+    """
+    Roasts a group of friends in one request: each member's Spotify profile, how their
+    tastes compare, every member's roast and one roast of the whole group. Answers 200 as
+    long as the request is valid; members whose profile could not be fetched or scored
+    come back with status "failed" and an error, and the group is roasted without them.
+    """
+    if any(not member.spotify_access_token for member in request.members):
+        raise HTTPException(status_code=400, detail="Missing Spotify Token")
+    try:
+        return await run_group_roast(request.members, request.bypass_cache)
     except Exception as e:
-        print(f"Roast generation failed: {e}")
+        logger.exception("Group roast failed")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await spotify.close()
+
+
+# --- Saved roasts (only when a database is configured) ---
+
+class SavedRoast(BaseModel):
+    id: RoastId
+    share_token: str
+    roast_text: str
+    persona: str | None = None
+    era: dict | None = None
+    hogwarts_house: dict | None = None
+    taste_score: int
+    roast_traits: list[str] | None = None
+    music_data: dict | None = None
+    source: str | None = None
+    created_at: datetime
+
+
+def _saved_roast(row: dict) -> SavedRoast:
+    return SavedRoast(**{k: v for k, v in row.items() if k not in ("user_id", "music_data_snapshot")},
+                      music_data=row.get("music_data_snapshot"))
+
+
+def _require_writer():
+    writer = get_roast_writer()
+    if writer is None:
+        raise HTTPException(status_code=404, detail="Roast history is not enabled")
+    return writer
+
+
+@router.get("/history", response_model=list[SavedRoast])
+async def roast_history(
+    limit: int = Query(20, ge=1, le=100),
+    before_id: int | None = Query(None, description="Id of the last roast on the previous page"),
+    current_user: dict = Depends(verify_token)
+):
+    """The signed-in user's saved roasts, newest first."""
+    rows = await _require_writer().list_for_user(user_id_of(current_user), limit=limit, before_id=before_id)
+    return [_saved_roast(row) for row in rows]
+
+
+@router.get("/saved/{roast_id}", response_model=SavedRoast)
+async def get_saved_roast(roast_id: int, current_user: dict = Depends(verify_token)):
+    """One of the signed-in user's saved roasts, by id."""
+    row = await _require_writer().get(roast_id)
+    if row is None or row["user_id"] != user_id_of(current_user):
+        raise HTTPException(status_code=404, detail="Roast not found")
+    return _saved_roast(row)
+
+
+@router.get("/shared/{share_token}", response_model=SavedRoast)
+async def get_shared_roast(share_token: str):
+    """A saved roast by its share token. Public: whoever has the link can read the roast."""
+    row = await _require_writer().get_shared(share_token)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Roast not found")
+    return _saved_roast(row)
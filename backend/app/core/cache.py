@@ -0,0 +1,96 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+# Sentinel so callers can cache None (e.g. negative lookups) and still tell a miss apart
+MISSING = object()
+
+
+def approx_size(value: Any) -> int:
+    """Rough serialized size of a cache value in bytes (pydantic models included)."""
+    if hasattr(value, "model_dump_json"):
+        return len(value.model_dump_json())
+    return len(json.dumps(value, default=str))
+
+
+class TTLCache:
+    """
+    Small in-process LRU cache with a per-entry TTL and hit/miss counters.
+    Optionally bounded by memory too: with max_bytes set, entries are sized with
+    `sizeof` and the least recently used ones are evicted once the total goes over.
+    Not thread-safe: it is meant to be used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 60.0,
+        max_bytes: int | None = None,
+        sizeof: Callable[[Any], int] = approx_size,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: OrderedDict[Hashable, tuple[float, Any, int]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        self._remove(key)
+        self._data[key] = (time.monotonic() + ttl, value, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._remove(key)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,26 +1,93 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
+import asyncio
+from contextlib import AsyncExitStack
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 
-# Ensure we use the async driver
-DATABASE_URL = os.getenv("DATABASE_URL")
-if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+def _async_url(url: str | None) -> str | None:
+    """Points plain postgres/sqlite URLs at the async drivers (asyncpg / aiosqlite)."""
+    if not url:
+        return None
+    for prefix, driver in (("postgres://", "postgresql+asyncpg://"), ("postgresql://", "postgresql+asyncpg://"),
+                           ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(prefix):
+            return driver + url[len(prefix):]
+    return url
 
-engine = create_async_engine(DATABASE_URL, echo=True)
 
-AsyncSessionLocal = sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autoflush=False,
-)
+DATABASE_URL = _async_url(os.getenv("DATABASE_URL"))
 
 Base = declarative_base()
 
+# Created on first use, so the app starts (and runs stateless) without a database
+_engine: AsyncEngine | None = None
+_sessionmaker: async_sessionmaker[AsyncSession] | None = None
+
+
+def database_configured() -> bool:
+    return DATABASE_URL is not None
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        if DATABASE_URL is None:
+            raise RuntimeError("DATABASE_URL is not set")
+        kwargs = {
+            "echo": os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes"),
+            "pool_pre_ping": True,
+        }
+        if DATABASE_URL.startswith("sqlite"):
+            _engine = create_async_engine(DATABASE_URL, connect_args={"timeout": 30}, **kwargs)
+
+            @event.listens_for(_engine.sync_engine, "connect")
+            def _sqlite_pragmas(dbapi_connection, _):
+                # WAL lets readers work while the write-behind flusher commits
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.close()
+        else:
+            _engine = create_async_engine(
+                DATABASE_URL,
+                pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+                pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+                **kwargs,
+            )
+    return _engine
+
+
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(
+            bind=get_engine(),
+            expire_on_commit=False,
+            autoflush=False,
+        )
+    return _sessionmaker
+
+
+async def warm_engine(connections: int = 4):
+    """Opens up to `connections` pooled connections now instead of on the first queries."""
+    engine = get_engine()
+    count = min(connections, engine.pool.size()) if hasattr(engine.pool, "size") else 1
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(*(stack.enter_async_context(engine.connect()) for _ in range(count)))
+
+
+async def dispose_engine():
+    global _engine, _sessionmaker
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _sessionmaker = None
+
+
 async def get_db():
-    async with AsyncSessionLocal() as session:
+    async with get_sessionmaker()() as session:
         yield session
@@ -0,0 +1,58 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# End-to-end budget for one roast, in seconds (0 disables it)
+ROAST_DEADLINE_SECONDS = float(os.getenv("ROAST_DEADLINE_SECONDS", "8"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised by a stage that cannot start because the request's budget is already spent."""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def use_deadline(deadline: Deadline | None):
+    """Makes `deadline` current for everything awaited inside the block, tasks it spawns included."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def deadline_scope(seconds: float | None = None):
+    """
+    Starts a new deadline for the block. Defaults to ROAST_DEADLINE_SECONDS;
+    a non-positive value means no deadline.
+    """
+    seconds = ROAST_DEADLINE_SECONDS if seconds is None else seconds
+    return use_deadline(Deadline(seconds) if seconds > 0 else None)
+
+
+def current_deadline() -> Deadline | None:
+    return _current_deadline.get()
+
+
+def time_left(margin: float = 0.0) -> float | None:
+    """Seconds left in the current deadline minus `margin`, or None when there is no deadline."""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline.remaining() - margin
@@ -0,0 +1,97 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from app.core.metrics import counter
+from app.core.tracing import current_trace
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is logged as a field
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "request_id"}
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+LOG_RECORDS_DROPPED = counter("roastmytune_log_records_dropped_total", "Log records dropped because the log queue was full")
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Tags records with the current request id (runs in the emitting task, before the queue)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace()
+        record.request_id = trace.request_id if trace else None
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drops (and counts) records when the queue is full instead of blocking or printing a traceback."""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class _LogListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room: the writer thread is still draining, and a dropped sentinel would hang stop()
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update({k: v for k, v in record.__dict__.items() if k not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """
+    Routes the `app` loggers through a QueueHandler so the event loop only enqueues records;
+    a background thread formats and writes them. LOG_FORMAT=json|text, LOG_LEVEL=INFO by default.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    # Bounded so a stalled stdout can't grow memory without limit; overflow is dropped and counted
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    logger = logging.getLogger("app")
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = _LogListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,160 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; covers cache hits (sub-ms) up to slow LLM completions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """A gauge whose samples are read from a callback at scrape time ({label values: value})."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), fn: Callable[[], Dict[LabelValues, float]] | None = None):
+        super().__init__(name, help, labelnames)
+        self._fns: List[Callable[[], Dict[LabelValues, float]]] = [fn] if fn else []
+
+    def add_source(self, fn: Callable[[], Dict[LabelValues, float]]):
+        self._fns.append(fn)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for fn in self._fns:
+            for key, value in sorted(fn().items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels((*self.labelnames, 'le'), (*key, le))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {self._sums[key]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def gauge(name: str, help: str, labelnames: Iterable[str] = (), fn=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames, fn))
+
+
+# Shared app metrics
+HTTP_REQUESTS = counter("roastmytune_http_requests_total", "HTTP requests handled", ["method", "route", "status"])
+HTTP_DURATION = histogram("roastmytune_http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+STAGE_DURATION = histogram("roastmytune_stage_duration_seconds", "Time spent per pipeline stage", ["stage"])
+CACHE_STATS = gauge("roastmytune_cache", "Cache statistics (size, bytes, hits, misses, evictions)", ["cache", "stat"])
+
+_caches: Dict[str, object] = {}
+
+def register_cache(name: str, cache):
+    """Exposes a cache's `stats` dict under roastmytune_cache{cache=name}."""
+    _caches[name] = cache
+
+def _cache_samples() -> Dict[LabelValues, float]:
+    samples = {}
+    for name, cache in _caches.items():
+        for stat, value in cache.stats.items():
+            samples[(name, stat)] = value
+    return samples
+
+CACHE_STATS.add_source(_cache_samples)
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Async token bucket shared by every caller of one upstream. Waiters reserve a token
+    up front (the balance may go negative), so they are released in arrival order at
+    `rate` per second. `pause(seconds)` stops all releases for a while (e.g. Retry-After).
+
+    The rate adapts: `slow_down()` halves it (down to `min_rate`) after the upstream
+    throttles us, and every successful call wins back a small step towards the configured rate.
+    A rate of 0 means no limit apart from pauses, until the upstream throttles us: then the
+    bucket starts limiting at half of `throttled_rate` and climbs back up, dropping the limit
+    again once it gets there.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None, min_rate: float | None = None, throttled_rate: float = 0.0):
+        self.max_rate = rate
+        self.rate = rate
+        # Where the adaptive rate climbs back to: the configured rate, or throttled_rate without one
+        self.ceiling = rate or throttled_rate
+        self.min_rate = min_rate if min_rate is not None else self.ceiling / 10
+        self.burst = burst if burst is not None else max(self.ceiling, 1.0)
+        self.tokens = self.burst
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """How long a caller arriving now would wait for a token."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.rate > 0 and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    async def acquire(self, max_wait: float | None = None) -> bool:
+        """Waits for a token. Returns False right away, without queueing, if that would take longer than max_wait."""
+        wait = self.delay()
+        if max_wait is not None and wait > max_wait:
+            return False
+        if self.rate > 0:
+            self.tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def slow_down(self):
+        if self.ceiling > 0:
+            self._refill(time.monotonic())
+            if self.rate == 0:
+                # Unlimited until now: start metering from an empty bucket
+                self.rate = self.ceiling
+                self.tokens = 0.0
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        if 0 < self.rate < self.ceiling:
+            self._refill(time.monotonic())
+            self.rate = min(self.ceiling, self.rate + self.ceiling / 100)
+            if self.rate >= self.ceiling:
+                self.rate = self.max_rate
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and then rejects calls for
+    `reset_timeout` seconds. After that one trial call is let through per timeout window;
+    a success closes the breaker again, a failure keeps it open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Let this call probe the upstream and re-arm the timer for everyone else
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
@@ -0,0 +1,66 @@
+import asyncio
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from app.core.cache import MISSING, TTLCache
+from app.core.metrics import counter, register_cache
+
+COALESCED = counter(
+    "roastmytune_singleflight_total",
+    "Calls per single-flight group: `leader` ran the work, `joined` shared an in-flight run, `recent` reused a just-finished result",
+    ["flight", "outcome"],
+)
+
+# How long a finished result keeps answering identical calls (double clicks, refreshes)
+SINGLEFLIGHT_WINDOW = float(os.getenv("SINGLEFLIGHT_WINDOW_SECONDS", "5"))
+
+
+def token_hash(token: str) -> str:
+    """Short stable digest so raw tokens never end up in keys or metrics."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+class SingleFlight:
+    """
+    Per-process request coalescing: concurrent calls with the same key share one execution.
+
+    The work runs in its own task and every caller awaits it through `asyncio.shield`, so a
+    caller that disconnects (and gets cancelled) only stops waiting; the run carries on for
+    the others and its result stays around for `window` seconds to answer immediate repeats.
+    Failures are handed to everyone waiting at that moment but are not kept.
+    """
+
+    def __init__(self, name: str, window: float = SINGLEFLIGHT_WINDOW, max_recent: int = 10000):
+        self.name = name
+        self.window = window
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent = TTLCache(max_entries=max_recent, ttl=window)
+        register_cache(f"singleflight_{name}", self._recent)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        recent = self._recent.get(key, MISSING)
+        if recent is not MISSING:
+            COALESCED.inc(flight=self.name, outcome="recent")
+            return recent
+
+        task = self._inflight.get(key)
+        if task is None:
+            COALESCED.inc(flight=self.name, outcome="leader")
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            COALESCED.inc(flight=self.name, outcome="joined")
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self._recent.set(key, task.result())
@@ -0,0 +1,335 @@
+"""
+Two-level cache: a per-process TTLCache in front of a tier shared by every worker on the host
+(SQLite by default, or Redis). The shared tier outlives the process: entries written by an
+earlier run are served after a restart until they expire, so set CACHE_BACKEND=none (or point
+CACHE_SQLITE_PATH at a fresh file) for anything that must start cold, such as benchmarks.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from app.core.cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Back tier shared by every worker process on the host: "sqlite" (default), "redis" or "none"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()
+# Defaults to a directory only this user can open (never a shared temp directory)
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "roastmytune", "cache.sqlite3"
+)
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_REDIS_PREFIX = os.getenv("CACHE_REDIS_PREFIX", "roastmytune:")
+
+# Entries: (value as JSON text, expires_at as wall-clock time, so every process agrees on it).
+# Only JSON is stored: reading an entry back can never run code, whoever wrote it.
+BackEntry = Tuple[str, float]
+
+
+def _create_private_file(path: str):
+    """
+    Creates `path` (and its directory) readable and writable by this user only, and refuses
+    files owned by someone else or reached through a symlink.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    try:
+        if os.fstat(fd).st_uid != os.getuid():
+            raise PermissionError(f"{path} is owned by another user")
+        os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+
+class SqliteCacheBackend:
+    """
+    Cache tier in a local SQLite file in WAL mode, shared by all worker processes on a host
+    and kept across restarts. The file is created private to the user running the app.
+    Calls run on one dedicated thread (with its own connection) so the event loop never
+    blocks on disk. Each namespace is capped at `max_bytes`: once over, expired entries and
+    then those closest to expiry are deleted (checked every `prune_every` writes).
+    """
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, prune_every: int = 500):
+        _create_private_file(path)
+        self.path = path
+        self.prune_every = prune_every
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-sqlite")
+        self._local = threading.local()
+        self._writes_since_prune: Dict[str, int] = {}
+        self.evictions = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, size INTEGER NOT NULL,"
+                " PRIMARY KEY (ns, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expiry ON cache_entries (ns, expires_at)")
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _get_many(self, ns: str, keys: List[str]) -> Dict[str, BackEntry]:
+        conn, now, found = self._conn(), time.time(), {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM cache_entries WHERE ns = ? AND expires_at > ? "
+                f"AND key IN ({','.join('?' * len(chunk))})",
+                (ns, now, *chunk),
+            )
+            for key, value, expires_at in rows:
+                found[key] = (value, expires_at)
+        return found
+
+    def _set_many(self, ns: str, items: Dict[str, BackEntry], max_bytes: int | None):
+        rows = [(ns, key, value, expires_at, len(value)) for key, (value, expires_at) in items.items()]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)", rows)
+        self._writes_since_prune[ns] = self._writes_since_prune.get(ns, 0) + len(rows)
+        if self._writes_since_prune[ns] >= self.prune_every:
+            self._writes_since_prune[ns] = 0
+            self._prune(ns, max_bytes)
+
+    def _prune(self, ns: str, max_bytes: int | None):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self.evictions += conn.execute(
+                "DELETE FROM cache_entries WHERE ns = ? AND expires_at <= ?", (ns, time.time())
+            ).rowcount
+            if max_bytes is None:
+                return
+            (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE ns = ?", (ns,)).fetchone()
+            excess = total - max_bytes
+            if excess <= 0:
+                return
+            doomed = []
+            for key, size in conn.execute(
+                "SELECT key, size FROM cache_entries WHERE ns = ? ORDER BY expires_at", (ns,)
+            ):
+                doomed.append((ns, key))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM cache_entries WHERE ns = ? AND key = ?", doomed)
+            self.evictions += len(doomed)
+
+    async def get_many(self, ns: str, keys: List[str]) -> Dict[str, BackEntry]:
+        return await self._run(self._get_many, ns, keys)
+
+    async def set_many(self, ns: str, items: Dict[str, BackEntry], max_bytes: int | None = None):
+        await self._run(self._set_many, ns, items, max_bytes)
+
+    async def close(self):
+        def _close():
+            conn = getattr(self._local, "conn", None)
+            if conn is not None:
+                conn.close()
+                self._local.conn = None
+        await self._run(_close)
+        self._executor.shutdown(wait=False)
+
+
+class RedisCacheBackend:
+    """
+    Cache tier on Redis (or anything speaking its protocol), shared across hosts.
+    Needs the `redis` package. Entries expire through Redis TTLs; the size limit is
+    Redis's own `maxmemory` policy (use allkeys-lru or volatile-lru). Values are stored
+    as "<expires_at>:<JSON>".
+    """
+
+    def __init__(self, url: str = CACHE_REDIS_URL, prefix: str = CACHE_REDIS_PREFIX):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis needs the redis package (pip install redis)") from e
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0  # done by Redis, not visible here
+
+    async def get_many(self, ns: str, keys: List[str]) -> Dict[str, BackEntry]:
+        blobs = await self._redis.mget([f"{self.prefix}{ns}:{key}" for key in keys])
+        now, found = time.time(), {}
+        for key, blob in zip(keys, blobs):
+            if blob is not None:
+                expires_at, _, value = blob.decode().partition(":")
+                if float(expires_at) > now:
+                    found[key] = (value, float(expires_at))
+        return found
+
+    async def set_many(self, ns: str, items: Dict[str, BackEntry], max_bytes: int | None = None):
+        now = time.time()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, (value, expires_at) in items.items():
+                ttl_ms = int((expires_at - now) * 1000)
+                if ttl_ms > 0:
+                    pipe.set(f"{self.prefix}{ns}:{key}", f"{expires_at!r}:{value}", px=ttl_ms)
+            await pipe.execute()
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+_backend = None
+_backend_failed = False
+
+
+def get_cache_backend():
+    """The process-wide back tier per CACHE_BACKEND, or None (also if it can't be opened)."""
+    global _backend, _backend_failed
+    if _backend is None and not _backend_failed:
+        try:
+            if CACHE_BACKEND == "sqlite":
+                _backend = SqliteCacheBackend()
+            elif CACHE_BACKEND == "redis":
+                _backend = RedisCacheBackend()
+            elif CACHE_BACKEND not in ("none", "memory"):
+                raise ValueError(f"Unknown CACHE_BACKEND {CACHE_BACKEND!r} (expected sqlite, redis or none)")
+        except Exception as e:
+            logger.error("Shared cache unavailable, using in-process caches only", extra={"error": str(e)})
+            _backend_failed = True
+    return _backend
+
+
+async def close_cache_backend():
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process TTLCache (LRU, optionally byte-bounded) in front of the
+    shared back tier (get_cache_backend()). Reads try the front tier, then the back tier,
+    and copy back-tier hits forward for their remaining TTL. Writes go to both.
+    Back-tier errors are logged and counted, never raised: callers just see a miss.
+
+    Keys must be strings. None can be cached (use `default=MISSING` to tell it from a miss).
+    The back tier holds JSON: `dump` turns a value into JSON-able data and `load` turns it
+    back (e.g. for pydantic models); entries that fail to load are dropped as misses. Values
+    come back from the back tier as copies, from the front tier as the same object.
+    Pass `backend=None` for a cache that must stay in this process.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        back_max_bytes: int | None = None,
+        backend=MISSING,
+        dump: Callable[[Any], Any] = lambda value: value,
+        load: Callable[[Any], Any] = lambda data: data,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.front = TTLCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+        self.back_max_bytes = back_max_bytes
+        self._backend = backend
+        self.dump = dump
+        self.load = load
+        self.back_hits = 0
+        self.back_misses = 0
+        self.back_errors = 0
+
+    @property
+    def back(self):
+        if self._backend is MISSING:
+            self._backend = get_cache_backend()
+        return self._backend
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        return (await self.get_many([key])).get(key, default)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Values for the keys that are cached (in either tier); missing keys are left out."""
+        found, missing = {}, []
+        for key in keys:
+            value = self.front.get(key, MISSING)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if not missing or self.back is None:
+            return found
+        try:
+            entries = await self.back.get_many(self.name, missing)
+        except Exception as e:
+            self._back_failed("read", e)
+            self.back_misses += len(missing)
+            return found
+        now, loaded = time.time(), 0
+        for key, (text, expires_at) in entries.items():
+            try:
+                value = self.load(json.loads(text))
+            except Exception as e:
+                self._back_failed("decode", e)
+                continue
+            found[key] = value
+            loaded += 1
+            self.front.set(key, value, ttl=expires_at - now)
+        self.back_hits += loaded
+        self.back_misses += len(missing) - loaded
+        return found
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        await self.set_many({key: value}, ttl=ttl)
+
+    async def set_many(self, items: Dict[str, Any], ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or not items:
+            return
+        for key, value in items.items():
+            self.front.set(key, value, ttl=ttl)
+        if self.back is None:
+            return
+        expires_at = time.time() + ttl
+        try:
+            entries = {k: (json.dumps(self.dump(v), separators=(",", ":")), expires_at) for k, v in items.items()}
+            await self.back.set_many(self.name, entries, self.back_max_bytes)
+        except Exception as e:
+            self._back_failed("write", e)
+
+    def _back_failed(self, op: str, error: Exception):
+        self.back_errors += 1
+        logger.warning("Shared cache access failed", extra={"cache": self.name, "op": op, "error": f"{type(error).__name__}: {error}"})
+
+    @property
+    def stats(self) -> dict:
+        front = self.front.stats
+        # A front miss is followed by a back lookup, so overall hits = front hits + back hits
+        hits = front["hits"] + self.back_hits
+        lookups = front["hits"] + front["misses"]
+        return {
+            "size": front["size"],
+            "bytes": front["bytes"],
+            "evictions": front["evictions"],
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "front_hits": front["hits"],
+            "front_misses": front["misses"],
+            "back_hits": self.back_hits,
+            "back_misses": self.back_misses,
+            "back_errors": self.back_errors,
+        }
@@ -0,0 +1,163 @@
+import functools
+import inspect
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Tuple
+from fastapi.routing import APIRoute
+from app.core.metrics import HTTP_DURATION, HTTP_REQUESTS, STAGE_DURATION
+
+# "off": never send Server-Timing, "opt-in": only when the request asks with
+# `X-Server-Timing: 1`, "always": on every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "opt-in").lower()
+
+
+class RequestTrace:
+    """Spans recorded while handling one request. Shared by every task the request spawns."""
+
+    def __init__(self):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.spans: List[Tuple[str, float]] = []
+        self.endpoint_returned_at: float | None = None
+
+    def add(self, name: str, ms: float):
+        self.spans.append((name, ms))
+
+    def server_timing(self) -> str:
+        totals: dict[str, list] = {}
+        for name, ms in self.spans:
+            total = totals.setdefault(name, [0.0, 0])
+            total[0] += ms
+            total[1] += 1
+        parts = []
+        for name, (ms, count) in totals.items():
+            part = f"{name};dur={ms:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        return ", ".join(parts)
+
+
+_current_trace: ContextVar[RequestTrace | None] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> RequestTrace | None:
+    return _current_trace.get()
+
+
+def record_span(name: str, ms: float):
+    """Records an already-measured stage duration."""
+    STAGE_DURATION.observe(ms / 1000, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, ms)
+
+
+@contextmanager
+def span(name: str):
+    """Times the enclosed block as pipeline stage `name` (works in sync and async code)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, (time.perf_counter() - started) * 1000)
+
+
+def _route_template(scope) -> str:
+    """
+    Path template of the matched route (e.g. /api/roast/generate), used as a low-cardinality label.
+    Depending on the FastAPI version the route's own path may or may not include the router
+    prefix, so the prefix is taken from the request path's leading segments.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None) or getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    prefix = "/".join(segments[:len(segments) - template.count("/")])
+    return prefix + template
+
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware (keeps contextvars flowing into the endpoint, unlike BaseHTTPMiddleware).
+    Opens a RequestTrace per HTTP request, records request counters/latency per route template,
+    and adds a Server-Timing header with the per-stage spans when enabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = 500
+        wants_timing = SERVER_TIMING == "always" or (
+            SERVER_TIMING == "opt-in" and (b"x-server-timing", b"1") in scope.get("headers", [])
+        )
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", trace.request_id.encode()))
+                if wants_timing:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    value = trace.server_timing()
+                    value = f"{value}, total;dur={total_ms:.1f}" if value else f"total;dur={total_ms:.1f}"
+                    headers.append((b"server-timing", value.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            route_path = _route_template(scope)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route_path, status=status)
+            HTTP_DURATION.observe(time.perf_counter() - started, method=scope["method"], route=route_path)
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that splits handler time into an `endpoint` span and a `serialization` span
+    (response model validation + JSON encoding, which FastAPI does after the endpoint returns).
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # include_router may rebuild the route from an endpoint that is already wrapped
+        if not inspect.iscoroutinefunction(endpoint) or getattr(endpoint, "_timed", False):
+            super().__init__(path, endpoint, **kwargs)
+            return
+
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kw):
+            with span("endpoint"):
+                result = await endpoint(*args, **kw)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.endpoint_returned_at = time.perf_counter()
+            return result
+
+        timed_endpoint._timed = True
+        super().__init__(path, timed_endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            trace = _current_trace.get()
+            if trace is not None and trace.endpoint_returned_at is not None:
+                record_span("serialization", (time.perf_counter() - trace.endpoint_returned_at) * 1000)
+            return response
+
+        return timed_handler
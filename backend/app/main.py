@@ -1,8 +1,67 @@
+import asyncio
+import sys
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import music, roast
+from app.core.logging_config import configure_logging, shutdown_logging
+from app.core.metrics import REGISTRY
+from app.core.tracing import TimingMiddleware
+from app.services.spotify_service import get_http_client, close_http_client
+from app.core.tiered_cache import close_cache_backend
+from app.services.genre_taxonomy import get_genre_taxonomy
+from app.services.roast_store import start_roast_writer, stop_roast_writer
+from app.services.warmup import STARTUP_WARMUP, timed_phase, warm_up
 
-app = FastAPI(title="RoastMyTune API")
+
+async def _warm_up_then_ready(app: FastAPI):
+    try:
+        await warm_up()
+    finally:
+        app.state.ready = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy SDKs (Gemini, Supabase, SQLAlchemy) are not imported here; they load on first
+    # use, or in the background warm-up below when STARTUP_WARMUP is on.
+    app.state.ready = False
+    with timed_phase("lifespan"):
+        configure_logging()
+        # One pooled Spotify client for the whole process
+        get_http_client()
+        # Compile the genre taxonomy up front instead of on the first request
+        get_genre_taxonomy()
+        # Worker pool for POST /api/roast/jobs
+        await roast.job_queue.start()
+        # Write-behind roast persistence (only with DATABASE_URL)
+        await start_roast_writer()
+    warmup_task = None
+    if STARTUP_WARMUP:
+        # Requests are served meanwhile; /ready reports 503 until the pools are open
+        warmup_task = asyncio.create_task(_warm_up_then_ready(app))
+    else:
+        app.state.ready = True
+    yield
+    # Stop taking new traffic from the load balancer while draining
+    app.state.ready = False
+    if warmup_task is not None:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    await roast.job_queue.stop()
+    await stop_roast_writer()
+    # Only if something opened the database; importing it would pull in SQLAlchemy
+    if "app.core.database" in sys.modules:
+        from app.core.database import dispose_engine
+
+        await dispose_engine()
+    await close_cache_backend()
+    await close_http_client()
+    shutdown_logging()
+
+
+app = FastAPI(title="RoastMyTune API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -11,11 +70,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-Id"],
 )
+# Per-request stage timings, request metrics and request ids for log correlation
+app.add_middleware(TimingMiddleware)
 
 @app.get("/")
 def read_root():
-    return {"message": "RoastMyTune API is running (No DB mode)"}
+    return {"message": "RoastMyTune API is running"}
+
+@app.get("/health", include_in_schema=False)
+def health():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+@app.get("/ready", include_in_schema=False)
+def ready():
+    """Readiness: startup (and the warm-up, if enabled) has finished."""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 app.include_router(music.router, prefix="/api/music", tags=["music"])
 app.include_router(roast.router, prefix="/api/roast", tags=["roast"])
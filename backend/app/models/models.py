@@ -1,19 +1,35 @@
-# Models are no longer used - app runs stateless without database
-# This file is kept for potential future database integration
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, JSON, String, Text
+from datetime import datetime, timezone
+from app.core.database import Base
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON
-from datetime import datetime
 
-# Note: If you want to re-enable database functionality in the future,
-# uncomment the database.py imports and re-add the models below.
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
 
-# from app.core.database import Base
-# 
-# class Roast(Base):
-#     __tablename__ = "roasts"
-#     id = Column(Integer, primary_key=True, index=True)
-#     user_id = Column(String, index=True, nullable=False)
-#     roast_text = Column(Text, nullable=False)
-#     taste_score = Column(Integer, nullable=False)
-#     music_data_snapshot = Column(JSON, nullable=True) 
-#     created_at = Column(DateTime, default=datetime.utcnow)
+
+class Roast(Base):
+    """
+    A generated roast, saved when DATABASE_URL is set (see app/services/roast_store.py).
+    Ids are assigned by the app before the row is written, so responses can carry them
+    while the insert is still queued. Ids sort by time and can be guessed; links to a
+    roast use the random share_token instead.
+    """
+    __tablename__ = "roasts"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(String, nullable=False)
+    share_token = Column(String(32), nullable=False, unique=True)
+    roast_text = Column(Text, nullable=False)
+    persona = Column(String, nullable=True)
+    era = Column(JSON, nullable=True)
+    hogwarts_house = Column(JSON, nullable=True)
+    taste_score = Column(Integer, nullable=False)
+    roast_traits = Column(JSON, nullable=True)
+    music_data_snapshot = Column(JSON, nullable=True)
+    source = Column(String(16), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=_utcnow, nullable=False)
+
+    __table_args__ = (
+        # Serves "a user's roasts, newest first" (ids sort by creation time)
+        Index("ix_roasts_user_id_id", "user_id", "id"),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class Artist(BaseModel):
     id: str
@@ -34,3 +34,36 @@ class MusicData(BaseModel):
     # The calculated score (added by ScoringService)
     taste_score: int
     roast_traits: List[str] # Keywords for the LLM (e.g., "Basic", "Depressing", "Boomer")
+
+class TasteDrift(BaseModel):
+    """How listening moved from an older time range to a newer one."""
+    from_range: str
+    to_range: str
+    artist_overlap: float # Jaccard similarity of the two top-artist sets (0-1)
+    track_overlap: float
+    genre_similarity: float # cosine similarity of the genre counts (0-1)
+    popularity_change: float # newer minus older average popularity
+    score_change: int
+    new_genres: List[str] # dominating genres of the newer range the older one never had
+    dropped_genres: List[str]
+
+class ExtendedMusicData(BaseModel):
+    # Keyed by Spotify time range: short_term (~4 weeks), medium_term (~6 months), long_term (years)
+    ranges: Dict[str, MusicData]
+    drift: List[TasteDrift]
+
+class MemberMatch(BaseModel):
+    """How close two group members' tastes are."""
+    members: List[str] # the two member names
+    artist_overlap: float # Jaccard similarity of their top artists (0-1)
+    track_overlap: float
+    genre_similarity: float # cosine similarity of the genre counts (0-1)
+    compatibility: int # 0-100, weighted mix of the three above
+
+class GroupComparison(BaseModel):
+    average_taste_score: float
+    most_basic: str # member with the lowest taste score
+    most_obscure: str # and the highest
+    shared_artists: List[str] # in the top artists of at least two members, most shared first
+    shared_genres: List[str] # dominating genres of at least two members
+    matches: List[MemberMatch] # every pair, most compatible first
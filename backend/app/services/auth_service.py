@@ -1,41 +1,210 @@
+import asyncio
+import hashlib
+import logging
 import os
-from supabase import create_client, Client
+import time
+import httpx
+import jwt
 from fastapi import HTTPException, Security, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from dotenv import load_dotenv
+from app.core.tiered_cache import TieredCache
+from app.core.metrics import register_cache
+from app.core.tracing import span
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Create client only if keys are present (lazy init or handle error)
-# For now, we assume they will be present at runtime
-supabase: Client = None
+# "remote" asks Supabase for every new token, "local" checks the JWT signature in-process
+SUPABASE_AUTH_MODE = os.getenv("SUPABASE_AUTH_MODE", "remote").lower()
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWT_ISSUER = os.getenv("SUPABASE_JWT_ISSUER")
+SUPABASE_JWKS_REFRESH_SECONDS = float(os.getenv("SUPABASE_JWKS_REFRESH_SECONDS", "600"))
 
-def get_supabase_client() -> Client:
+# Verified tokens are remembered briefly (never past their own expiry). This cache stays in
+# the process: an entry here skips verification, so it must never come from shared storage.
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+_token_cache = TieredCache(
+    "auth_tokens", ttl=AUTH_TOKEN_CACHE_TTL, max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")), backend=None
+)
+register_cache("auth_tokens", _token_cache)
+
+# Created on first use; the supabase package is only imported then (local mode never needs it)
+supabase = None
+
+def get_supabase_client():
     global supabase
     if supabase is None:
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set")
+        from supabase import create_client
+
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
     return supabase
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
+
+class LocalJWTVerifier:
     """
-    Verifies the JWT token from the Authorization header using Supabase.
-    Returns the user data if valid.
+    Verifies Supabase access tokens without a network round trip.
+    Uses the project's HS256 JWT secret when given, otherwise the signing keys from the
+    JWKS endpoint. The key set is cached and refreshed in the background once it goes stale;
+    an unknown `kid` (key rotation) forces a refresh, at most once per `min_refresh_interval`.
     """
-    token = credentials.credentials
+
+    def __init__(
+        self,
+        secret: str | None = None,
+        jwks_url: str | None = None,
+        audience: str | None = "authenticated",
+        issuer: str | None = None,
+        refresh_interval: float = 600.0,
+        min_refresh_interval: float = 30.0,
+        leeway: float = 10.0,
+    ):
+        if not secret and not jwks_url:
+            raise ValueError("LocalJWTVerifier needs either a JWT secret or a JWKS URL")
+        self.secret = secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.issuer = issuer
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+    async def verify(self, token: str) -> dict:
+        """Returns the token claims, or raises jwt.PyJWTError."""
+        header = jwt.get_unverified_header(token)
+        alg = header.get("alg")
+        if alg == "HS256" and self.secret:
+            key, algorithms = self.secret, ["HS256"]
+        elif self.jwks_url and alg != "HS256":
+            jwk = await self._get_jwk(header.get("kid"))
+            key, algorithms = jwk.key, [jwk.algorithm_name]
+        else:
+            raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {alg}")
+
+        return jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience=self.audience,
+            issuer=self.issuer,
+            leeway=self.leeway,
+            options={"require": ["exp", "sub"], "verify_aud": self.audience is not None},
+        )
+
+    async def refresh(self):
+        """Fetches the JWKS and swaps in the new key set."""
+        async with self._lock:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.get(self.jwks_url)
+                response.raise_for_status()
+                jwks = jwt.PyJWKSet.from_dict(response.json())
+            self._keys = {k.key_id: k for k in jwks.keys if k.key_id}
+            self._fetched_at = time.monotonic()
+
+    async def _get_jwk(self, kid: str | None) -> jwt.PyJWK:
+        age = time.monotonic() - self._fetched_at
+        if not self._keys:
+            await self.refresh()
+        elif age > self.refresh_interval and (self._refresh_task is None or self._refresh_task.done()):
+            # Keep serving the cached keys while the new set loads
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+
+        if kid not in self._keys and age > self.min_refresh_interval:
+            await self.refresh()
+        if kid not in self._keys:
+            raise jwt.InvalidKeyError(f"Unknown signing key: {kid}")
+        return self._keys[kid]
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning("JWKS refresh failed, keeping cached keys", extra={"error": str(e)})
+
+
+_local_verifier: LocalJWTVerifier | None = None
+
+def get_local_verifier() -> LocalJWTVerifier:
+    global _local_verifier
+    if _local_verifier is None:
+        _local_verifier = LocalJWTVerifier(
+            secret=SUPABASE_JWT_SECRET,
+            jwks_url=SUPABASE_JWKS_URL,
+            audience=SUPABASE_JWT_AUDIENCE or None,
+            issuer=SUPABASE_JWT_ISSUER,
+            refresh_interval=SUPABASE_JWKS_REFRESH_SECONDS,
+        )
+    return _local_verifier
+
+
+def _claims_to_user(claims: dict) -> dict:
+    """Shapes JWT claims like the Supabase user object (id, email, role, metadata)."""
+    return {
+        "id": claims["sub"],
+        "email": claims.get("email"),
+        "role": claims.get("role"),
+        "aud": claims.get("aud"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+    }
+
+
+def user_id_of(user) -> str:
+    """The Supabase user id, whether `user` came from local verification (dict) or Supabase (User)."""
+    return user["id"] if isinstance(user, dict) else user.id
+
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
+    """
+    Verifies the JWT token from the Authorization header.
+    In "remote" mode this asks Supabase (off the event loop); in "local" mode the signature
+    and expiry are checked in-process. Returns the user data if valid.
+    """
+    with span("auth"):
+        return await _verify(credentials.credentials)
+
+
+async def _verify(token: str):
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    cached = await _token_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if SUPABASE_AUTH_MODE == "local":
+        try:
+            claims = await get_local_verifier().verify(token)
+        except jwt.PyJWTError as e:
+            raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=503, detail=f"Could not load signing keys: {str(e)}")
+        user = _claims_to_user(claims)
+        await _token_cache.set(cache_key, user, ttl=min(AUTH_TOKEN_CACHE_TTL, claims["exp"] - time.time()))
+        return user
+
     client = get_supabase_client()
-    
+
     try:
-        # get_user verifies the JWT signature and expiration
-        response = client.auth.get_user(token)
+        # get_user verifies the JWT signature and expiration (blocking call, so use a thread)
+        response = await run_in_threadpool(client.auth.get_user, token)
         if not response.user:
              raise HTTPException(status_code=401, detail="Invalid token")
+        # Signature was checked by Supabase, so the unverified exp is safe to read here
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp", time.time() + AUTH_TOKEN_CACHE_TTL)
+        await _token_cache.set(cache_key, response.user, ttl=min(AUTH_TOKEN_CACHE_TTL, exp - time.time()))
         return response.user
     except Exception as e:
         # In a real app we might check specifically for expired token errors
@@ -0,0 +1,209 @@
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+import numpy as np
+from app.schemas.music import Artist, Track
+from app.services.genre_taxonomy import GenreTaxonomy, get_genre_taxonomy
+from app.services.scoring_service import POPULARITY_TIERS, profile_fingerprint
+
+MAX_TRAITS = 4
+TOP_GENRES = 5
+
+
+@dataclass
+class ProfileBatch:
+    """
+    Many listening profiles in columnar form. Per-profile lists are flattened and
+    delimited by offsets (profile i owns items offsets[i]:offsets[i + 1]).
+    Genres are ids into `genre_vocab`, listed in artist order like the per-user path sees them.
+    Audio features are per track and NaN where unknown.
+    `seeds` drive the -5..+5 jitter; from_profiles derives them from the profile fingerprint.
+    """
+    artist_offsets: np.ndarray
+    artist_popularity: np.ndarray
+    track_offsets: np.ndarray
+    track_popularity: np.ndarray
+    genre_offsets: np.ndarray
+    genre_ids: np.ndarray
+    genre_vocab: List[str]
+    seeds: np.ndarray
+    danceability: np.ndarray | None = None
+    energy: np.ndarray | None = None
+    valence: np.ndarray | None = None
+    tempo: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.artist_offsets) - 1
+
+    @classmethod
+    def from_profiles(cls, profiles: Sequence[Tuple[List[Artist], List[Track]]]) -> "ProfileBatch":
+        vocab: dict[str, int] = {}
+        artist_offsets, track_offsets, genre_offsets = [0], [0], [0]
+        artist_pop, track_pop, genre_ids, seeds = [], [], [], []
+        features = {name: [] for name in ("danceability", "energy", "valence", "tempo")}
+
+        for top_artists, top_tracks in profiles:
+            artist_pop.extend(a.popularity for a in top_artists)
+            track_pop.extend(t.popularity for t in top_tracks)
+            for a in top_artists:
+                genre_ids.extend(vocab.setdefault(g, len(vocab)) for g in a.genres)
+            for name, values in features.items():
+                values.extend(np.nan if getattr(t, name) is None else getattr(t, name) for t in top_tracks)
+            artist_offsets.append(len(artist_pop))
+            track_offsets.append(len(track_pop))
+            genre_offsets.append(len(genre_ids))
+            seeds.append(int(profile_fingerprint(top_artists, top_tracks)[:16], 16))
+
+        return cls(
+            artist_offsets=np.asarray(artist_offsets, dtype=np.int64),
+            artist_popularity=np.asarray(artist_pop, dtype=np.int64),
+            track_offsets=np.asarray(track_offsets, dtype=np.int64),
+            track_popularity=np.asarray(track_pop, dtype=np.int64),
+            genre_offsets=np.asarray(genre_offsets, dtype=np.int64),
+            genre_ids=np.asarray(genre_ids, dtype=np.int64),
+            genre_vocab=list(vocab),
+            seeds=np.asarray(seeds, dtype=np.uint64),
+            **{name: np.asarray(values, dtype=np.float64) for name, values in features.items()},
+        )
+
+
+@dataclass
+class BatchScores:
+    """Per-profile results as arrays. Rows where `valid` is False had no artists or tracks."""
+    valid: np.ndarray
+    average_popularity: np.ndarray
+    taste_score: np.ndarray
+    popularity_tier: np.ndarray   # 0 = most mainstream ... 4 = most obscure
+    top_genre_ids: np.ndarray     # (n, 5), -1 padded
+    trait_ids: np.ndarray         # (n, 4), -1 padded
+    era_ids: np.ndarray
+    mean_features: dict           # name -> (n,) float, NaN where no track had the feature
+    genre_vocab: List[str]
+    trait_vocab: List[str]
+    era_vocab: List[str]
+
+    def row(self, i: int) -> dict | None:
+        """One profile's result in the same terms as MusicData (None for invalid rows)."""
+        if not self.valid[i]:
+            return None
+        return {
+            "average_popularity": float(self.average_popularity[i]),
+            "taste_score": int(self.taste_score[i]),
+            "popularity_tier": int(self.popularity_tier[i]),
+            "dominating_genres": [self.genre_vocab[g] for g in self.top_genre_ids[i] if g >= 0],
+            "roast_traits": [self.trait_vocab[t] for t in self.trait_ids[i] if t >= 0],
+            "musical_era": self.era_vocab[self.era_ids[i]],
+            **{name: float(values[i]) for name, values in self.mean_features.items()},
+        }
+
+
+class BatchScoringService:
+    """
+    Vectorized version of ScoringService.calculate_score for rescoring many stored profiles
+    at once (formula changes, friend-group comparisons). For the same profile it produces
+    exactly the score, traits, genres and era the per-user path does.
+    """
+
+    def __init__(self, taxonomy: GenreTaxonomy | None = None):
+        self.taxonomy = taxonomy or get_genre_taxonomy()
+
+    def score(self, batch: ProfileBatch) -> BatchScores:
+        n = len(batch)
+        taxonomy = self.taxonomy
+
+        # 1. Average popularity (sums of ints are exact in float64, so this matches sum()/len())
+        artist_counts = np.diff(batch.artist_offsets)
+        track_counts = np.diff(batch.track_offsets)
+        valid = (artist_counts > 0) & (track_counts > 0)
+        artist_owner = np.repeat(np.arange(n), artist_counts)
+        track_owner = np.repeat(np.arange(n), track_counts)
+        artist_sum = np.bincount(artist_owner, weights=batch.artist_popularity, minlength=n)
+        track_sum = np.bincount(track_owner, weights=batch.track_popularity, minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            overall_pop = (track_sum / track_counts + artist_sum / artist_counts) / 2
+
+        # 2. Dominating genres: Counter.most_common(5) order, i.e. count desc then first appearance
+        vocab_size = max(len(batch.genre_vocab), 1)
+        genre_owner = np.repeat(np.arange(n), np.diff(batch.genre_offsets))
+        keys = genre_owner * vocab_size + batch.genre_ids
+        unique_keys, first_pos, counts = np.unique(keys, return_index=True, return_counts=True)
+        key_owner = unique_keys // vocab_size
+        key_genre = unique_keys % vocab_size
+        order = np.lexsort((first_pos, -counts, key_owner))
+        key_owner, key_genre = key_owner[order], key_genre[order]
+        unique_genres = np.bincount(key_owner, minlength=n)
+        group_start = np.concatenate(([0], np.cumsum(unique_genres)[:-1]))
+        rank = np.arange(len(key_owner)) - group_start[key_owner]
+        top = rank < TOP_GENRES
+        top_owner, top_genre, top_rank = key_owner[top], key_genre[top], rank[top]
+        top_genre_ids = np.full((n, TOP_GENRES), -1, dtype=np.int64)
+        top_genre_ids[top_owner, top_rank] = top_genre
+
+        # Classify each vocabulary entry once
+        infos = [taxonomy.classify(g) for g in batch.genre_vocab]
+        trait_names = list(dict.fromkeys(trait for _, trait in taxonomy.trait_order))
+        genre_delta = np.array([info.score_delta for info in infos] or [0], dtype=np.float64)
+        genre_era_rank = np.array([info.era_rank for info in infos] or [0], dtype=np.int64)
+        genre_traits = np.zeros((vocab_size, len(trait_names)), dtype=np.int64)
+        for g, info in enumerate(infos):
+            for name, trait in taxonomy.trait_order:
+                if name in info.categories:
+                    genre_traits[g, trait_names.index(trait)] = 1
+
+        # 3. Score
+        score = 100 - overall_pop
+        score = score + np.bincount(top_owner, weights=genre_delta[top_genre], minlength=n)
+        score = score + np.where(unique_genres > 15, 10, np.where(unique_genres > 10, 5, 0))
+        score = score + (batch.seeds % np.uint64(11)).astype(np.int64) - 5
+        taste_score = np.clip(np.trunc(np.nan_to_num(score)), 0, 100).astype(np.int64)
+
+        # 4. Traits: popularity tier traits, then genre traits in taxonomy order, first 4
+        tier = np.full(n, len(POPULARITY_TIERS) - 1, dtype=np.int64)
+        for i in reversed(range(len(POPULARITY_TIERS) - 1)):
+            tier = np.where(overall_pop > POPULARITY_TIERS[i][0], i, tier)
+        tier_names = [t for _, tier_traits in POPULARITY_TIERS for t in tier_traits]
+        trait_vocab = tier_names + trait_names
+        width = max(len(tier_traits) for _, tier_traits in POPULARITY_TIERS)
+        tier_table = np.full((len(POPULARITY_TIERS), width), -1, dtype=np.int64)
+        offset = 0
+        for i, (_, tier_traits) in enumerate(POPULARITY_TIERS):
+            tier_table[i, :len(tier_traits)] = np.arange(offset, offset + len(tier_traits))
+            offset += len(tier_traits)
+
+        genre_flags = np.zeros((n, len(trait_names)), dtype=np.int64)
+        np.add.at(genre_flags, top_owner, genre_traits[top_genre])
+        genre_candidates = np.where(genre_flags > 0, len(tier_names) + np.arange(len(trait_names)), -1)
+        candidates = np.concatenate([tier_table[tier], genre_candidates], axis=1)
+        compact = np.argsort(candidates < 0, axis=1, kind="stable")
+        trait_ids = np.take_along_axis(candidates, compact, axis=1)[:, :MAX_TRAITS]
+
+        # 5. Era: best-ranked era across the top genres, "Modern" if none
+        era_vocab = taxonomy.era_labels + ["Modern"]
+        era_ids = np.full(n, len(era_vocab) - 1, dtype=np.int64)
+        np.minimum.at(era_ids, top_owner, genre_era_rank[top_genre])
+
+        # 6. Audio features (not part of the score yet): per-profile means
+        mean_features = {}
+        for name in ("danceability", "energy", "valence", "tempo"):
+            values = getattr(batch, name)
+            if values is None:
+                mean_features[f"mean_{name}"] = np.full(n, np.nan)
+                continue
+            known = ~np.isnan(values)
+            total = np.bincount(track_owner, weights=np.where(known, values, 0.0), minlength=n)
+            seen = np.bincount(track_owner, weights=known, minlength=n)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_features[f"mean_{name}"] = total / seen
+
+        return BatchScores(
+            valid=valid,
+            average_popularity=overall_pop,
+            taste_score=taste_score,
+            popularity_tier=tier,
+            top_genre_ids=top_genre_ids,
+            trait_ids=trait_ids,
+            era_ids=era_ids,
+            mean_features=mean_features,
+            genre_vocab=batch.genre_vocab,
+            trait_vocab=trait_vocab,
+            era_vocab=era_vocab,
+        )
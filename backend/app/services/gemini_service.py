@@ -1,75 +1,592 @@
-import google.generativeai as genai
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator
 import os
-from app.schemas.music import MusicData
+from app.schemas.music import GroupComparison, MusicData
+from app.core.tiered_cache import TieredCache
+from app.core.deadline import Deadline, current_deadline, time_left
+from app.core.metrics import counter, gauge, histogram, register_cache
+from app.core.tracing import record_span, span
+from app.services.roast_prompts import (
+    GEMINI_MAX_OUTPUT_TOKENS,
+    GROUP_PROMPT,
+    ROAST_PROMPT,
+    PromptTemplate,
+    estimate_tokens,
+    group_user_prompt,
+    roast_user_prompt,
+)
+from app.services.template_roast import template_group_roast, template_roast
+
+logger = logging.getLogger(__name__)
+
+LLM_REQUESTS = counter("roastmytune_llm_requests_total", "Roast requests by how they were answered", ["outcome"])
+LLM_HEDGES = counter("roastmytune_llm_hedges_total", "Hedged Gemini requests: `sent`, and `won` when the hedge answered first", ["result"])
+LLM_TOKENS = histogram(
+    "roastmytune_llm_tokens",
+    "Tokens per Gemini call by prompt template and kind (prompt or output); as reported by Gemini, else estimated",
+    ["prompt", "kind"],
+    buckets=(50, 100, 200, 400, 800, 1600, 3200, 6400),
+)
+LLM_PARSE_FAILURES = counter("roastmytune_llm_parse_failures_total", "Gemini answers without a usable JSON object, by prompt template", ["prompt"])
+PROMPT_ITEMS_TRIMMED = counter(
+    "roastmytune_prompt_items_trimmed_total", "Artists, tracks, genres etc. left out of prompts to fit the token budget", ["prompt"]
+)
+
+# Time kept back from the request deadline for building and serializing the response
+ROAST_DEADLINE_MARGIN = float(os.getenv("ROAST_DEADLINE_MARGIN_SECONDS", "0.05"))
+# Group roasts: member roasts packed into one LLM call
+GEMINI_PACK_SIZE = max(1, int(os.getenv("GEMINI_PACK_SIZE", "4")))
+# Ask for JSON matching the prompt's response schema (response_mime_type + response_schema)
+GEMINI_STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "true").strip().lower() in ("1", "true", "yes", "on")
 
 class GeminiService:
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not set")
-        genai.configure(api_key=api_key)
-        # Use the latest stable model
-        self.model = genai.GenerativeModel('models/gemini-2.5-flash-lite')
-
-    async def generate_roast(self, music_data: MusicData) -> dict:
+    """
+    App-scoped Gemini client. Use get_gemini_service() rather than building one per request.
+    Calls go through the library's async API and a semaphore that caps in-flight LLM requests;
+    time spent waiting for a slot is tracked as the queue-wait metric.
+    """
+
+    def __init__(self, model=None, max_concurrency: int | None = None):
+        if model is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not set")
+            # The SDK takes ~0.4s to import, so it is only loaded once a real model is needed
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            # Use the latest stable model; one per prompt template, carrying its static
+            # instructions as the system instruction so requests only send the user part
+            self._models = {
+                template.name: genai.GenerativeModel('models/gemini-2.5-flash-lite', system_instruction=template.system_instruction)
+                for template in (ROAST_PROMPT, GROUP_PROMPT)
+            }
+            model = self._models[ROAST_PROMPT.name]
+        else:
+            # An injected model (benchmarks) gets the instructions in front of each prompt
+            self._models = None
+        self.model = model
+
+        self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.queue_wait_ms_total = 0.0
+        self.queue_wait_ms_max = 0.0
+
+        # Hedging: once a call has taken longer than this percentile of recent generation
+        # latencies, a second identical request is sent and whichever answers first wins.
+        # 0 disables it. Hedges are only sent while there is no queue for a slot.
+        self.hedge_percentile = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0"))
+        self.hedge_min_samples = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "50"))
+        self._latencies: deque[float] = deque(maxlen=1000)
+
+        # Repeat profiles (same top artists/tracks/genres/traits, similar score) skip the LLM,
+        # whichever worker generated the roast first
+        self.cache = TieredCache(
+            "roasts",
+            ttl=float(os.getenv("ROAST_CACHE_TTL", "86400")),
+            max_entries=int(os.getenv("ROAST_CACHE_SIZE", "5000")),
+            back_max_bytes=int(float(os.getenv("ROAST_SHARED_CACHE_MAX_MB", "256")) * 1024 * 1024),
+        )
+        register_cache("roasts", self.cache)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "queue_wait_ms_avg": self.queue_wait_ms_total / self.calls if self.calls else 0.0,
+            "queue_wait_ms_max": self.queue_wait_ms_max,
+            "roast_cache": self.cache.stats,
+        }
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Holds one concurrency slot for the duration of an LLM call."""
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait_ms = (time.perf_counter() - queued_at) * 1000
+        record_span("llm.queue_wait", wait_ms)
+        self.calls += 1
+        self.queue_wait_ms_total += wait_ms
+        self.queue_wait_ms_max = max(self.queue_wait_ms_max, wait_ms)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _request(self, template: PromptTemplate, prompt: str, outputs: int = 1) -> tuple[object, str, dict]:
+        """The model, contents and generation_config for a call with `prompt` as the user part."""
+        config = template.generation_config(GEMINI_MAX_OUTPUT_TOKENS * outputs, structured=GEMINI_STRUCTURED_OUTPUT)
+        if self._models is not None:
+            return self._models[template.name], prompt, config
+        return self.model, f"{template.system_instruction}\n\n{prompt}", config
+
+    @staticmethod
+    def _record_tokens(template: PromptTemplate, prompt: str, output: str, usage=None):
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or template.system_tokens + estimate_tokens(prompt)
+        output_tokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(output)
+        LLM_TOKENS.observe(prompt_tokens, prompt=template.name, kind="prompt")
+        LLM_TOKENS.observe(output_tokens, prompt=template.name, kind="output")
+
+    async def _generate(self, template: PromptTemplate, prompt: str, outputs: int = 1):
+        """Runs one generate_content call once a concurrency slot is free."""
+        model, contents, config = self._request(template, prompt, outputs)
+        async with self._slot():
+            with span("llm.generate"):
+                started = time.perf_counter()
+                response = await model.generate_content_async(contents, generation_config=config)
+                self._latencies.append(time.perf_counter() - started)
+        try:
+            text = response.text
+        except ValueError:
+            # No text parts (e.g. blocked by safety settings)
+            text = ""
+        self._record_tokens(template, prompt, text, getattr(response, "usage_metadata", None))
+        return response
+
+    def _hedge_delay(self) -> float | None:
+        if self.hedge_percentile <= 0 or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))]
+
+    async def _generate_hedged(self, template: PromptTemplate, prompt: str, outputs: int = 1):
+        """_generate, plus a hedge request if the first one is slower than usual."""
+        delay = self._hedge_delay()
+        primary = asyncio.ensure_future(self._generate(template, prompt, outputs))
+        if delay is None:
+            return await primary
+
+        pending = {primary}
+        failure = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and self.waiting == 0:
+                LLM_HEDGES.inc(result="sent")
+                pending.add(asyncio.ensure_future(self._generate(template, prompt, outputs)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            LLM_HEDGES.inc(result="won")
+                        return task.result()
+                    failure = task.exception()
+            raise failure
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def _roast_prompt(music_data: MusicData) -> str:
+        prompt, dropped = roast_user_prompt(music_data)
+        if dropped:
+            PROMPT_ITEMS_TRIMMED.inc(dropped, prompt=ROAST_PROMPT.name)
+        logger.debug("Built roast prompt", extra={"tokens": estimate_tokens(prompt), "trimmed": dropped})
+        return prompt
+
+    async def generate_roast(self, music_data: MusicData, use_cache: bool = True) -> dict:
         """
         Generates a brutal roast and a persona based on the user's music data.
-        Returns: {'roast': str, 'persona': str}
+        Returns: {'roast': str, 'persona': str, 'era': dict, 'hogwarts_house': dict, 'source': str}
+        `source` is "cache", "llm", or "template" when the LLM failed or the request deadline
+        (see app.core.deadline) ran out first.
+        With use_cache=False the cache is not read, but the fresh roast still replaces the entry.
         """
+        cache_key = roast_cache_key(music_data)
+        if use_cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                LLM_REQUESTS.inc(outcome="cache_hit")
+                return {**copy.deepcopy(cached), "source": "cache"}
+
+        budget = time_left(ROAST_DEADLINE_MARGIN)
+        if budget is not None and budget <= 0:
+            LLM_REQUESTS.inc(outcome="deadline")
+            return {**template_roast(music_data), "source": "template"}
+
+        prompt = self._roast_prompt(music_data)
         
-        # Construct the prompt
-        top_artists = ", ".join([a.name for a in music_data.top_artists[:5]])
-        top_tracks = ", ".join([f"{t.name} by {t.artist_names[0]}" for t in music_data.top_tracks[:5]])
-        genres = ", ".join(music_data.dominating_genres) if music_data.dominating_genres else "unknown"
-        traits = ", ".join(music_data.roast_traits) if music_data.roast_traits else "mysterious"
-        
-        print(f"[Gemini] Generating roast for: Artists={top_artists}, Tracks={top_tracks}")
-        
-        prompt = f"""
-        You are a mean, brutal, Gen-Z music critic. Your job is to ROAST the user's music taste and assign them a specific, funny archetypal PERSONA.
-        
-        USER DATA:
-        - Top Artists: {top_artists}
-        - Top Tracks: {top_tracks}
-        - Top Genres: {genres}
-        - Taste Score: {music_data.taste_score}/100 (Lower is more "basic")
-        - Traits: {traits}
+        try:
+            response = await asyncio.wait_for(self._generate_hedged(ROAST_PROMPT, prompt), budget)
+            data = parse_roast_json(response.text)
+            if data is None:
+                LLM_PARSE_FAILURES.inc(prompt=ROAST_PROMPT.name)
+                raise ValueError(f"Model returned unparseable output: {response.text[:200]!r}")
+            
+            logger.info("Roast generated", extra={"persona": data.get("persona")})
+            LLM_REQUESTS.inc(outcome="success")
+            await self.cache.set(cache_key, copy.deepcopy(data))
+            return {**data, "source": "llm"}
+        except asyncio.TimeoutError:
+            logger.warning("Roast deadline reached, using template", extra=_budget_extra(budget))
+            LLM_REQUESTS.inc(outcome="deadline")
+            return {**template_roast(music_data), "source": "template"}
+        except Exception as e:
+            logger.error("Roast generation failed, using template", extra={"error": f"{type(e).__name__}: {e}"})
+            LLM_REQUESTS.inc(outcome="fallback")
+            return {**template_roast(music_data), "source": "template"}
+
+    async def stream_roast(
+        self, music_data: MusicData, use_cache: bool = True, deadline: Deadline | None = None
+    ) -> AsyncIterator[tuple[str, object]]:
+        """
+        Streams a roast as it is generated.
+        Yields ("token", str) for each new piece of the roast text, then exactly one
+        ("result", dict) with the same shape generate_roast returns. Partial or invalid
+        model output is completed from the template roast, keeping any roast text that
+        already streamed (source "llm_partial").
+        The request deadline bounds the wait for the first chunk; once text is flowing
+        the stream runs to completion. Pass `deadline` explicitly when the generator is
+        consumed outside the block that set it (e.g. by a StreamingResponse).
+        """
+        deadline = deadline or current_deadline()
+        cache_key = roast_cache_key(music_data)
+        if use_cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                LLM_REQUESTS.inc(outcome="cache_hit")
+                yield "token", cached["roast"]
+                yield "result", {**copy.deepcopy(cached), "source": "cache"}
+                return
+
+        prompt = self._roast_prompt(music_data)
+        model, contents, config = self._request(ROAST_PROMPT, prompt)
+        extractor = RoastTextExtractor()
+        usage = None
+        text = ""
         
-        INSTRUCTIONS:
-        1. **ROAST**: Write a short, biting paragraph (3-4 sentences) directly addressing the user. Mention specific artists. Be ruthless.
-        2. **PERSONA**: Give them a short, funny 3-5 word title describing their vibe (e.g., "Sad 2014 Indie Kid", "Gas Station Drake Fan").
-        3. **ERA**: Tell them what year they are mentally stuck in. Provide a Title (e.g. "2016 SoundCloud Rap Era") and a short Description.
-        4. **HOGWARTS HOUSE**: Sort them into a Harry Potter House based *solely* on music vibe. Provide the House Name and a snarky 1-sentence Reason.
+        stream_started = None
+        timed_out = False
+        try:
+            async with AsyncExitStack() as stack:
+                async def open_stream():
+                    nonlocal stream_started
+                    await stack.enter_async_context(self._slot())
+                    stream_started = time.perf_counter()
+                    response = await model.generate_content_async(contents, stream=True, generation_config=config)
+                    chunks = response.__aiter__()
+                    return chunks, await anext(chunks, None)
+
+                budget = deadline.remaining() - ROAST_DEADLINE_MARGIN if deadline else None
+                if budget is not None and budget <= 0:
+                    raise asyncio.TimeoutError
+                chunks, first = await asyncio.wait_for(open_stream(), budget)
+
+                async def rest():
+                    if first is not None:
+                        yield first
+                    async for chunk in chunks:
+                        yield chunk
+
+                async for chunk in rest():
+                    # The last chunk carries the usage totals
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    try:
+                        piece = chunk.text
+                    except ValueError:
+                        # Chunks without text parts (e.g. safety metadata only)
+                        continue
+                    text += piece
+                    delta = extractor.feed(piece)
+                    if delta:
+                        yield "token", delta
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.warning("Roast deadline reached before the first chunk, using template")
+        except Exception as e:
+            logger.error("Roast streaming failed", extra={"error": f"{type(e).__name__}: {e}"})
+        if stream_started is not None:
+            record_span("llm.stream", (time.perf_counter() - stream_started) * 1000)
+            self._record_tokens(ROAST_PROMPT, prompt, text, usage)
         
-        FORMAT:
-        Return ONLY valid JSON with no markdown formatting.
-        {{
-            "roast": "...",
-            "persona": "...",
-            "era": {{
-                "title": "...",
-                "description": "..."
-            }},
-            "hogwarts_house": {{
-                "house": "...",
-                "reason": "..."
-            }}
-        }}
+        data = parse_roast_json(text)
+        if data is None:
+            if text:
+                LLM_PARSE_FAILURES.inc(prompt=ROAST_PROMPT.name)
+            data = {**template_roast(music_data), "source": "template"}
+            if extractor.text:
+                logger.warning("Streamed output was not valid JSON, completing it from the template", extra={"chars": len(text)})
+                data.update(roast=extractor.text, source="llm_partial")
+            else:
+                yield "token", data["roast"]
+            LLM_REQUESTS.inc(outcome="deadline" if timed_out else "fallback")
+        else:
+            LLM_REQUESTS.inc(outcome="success")
+            await self.cache.set(cache_key, copy.deepcopy(data))
+            data = {**data, "source": "llm"}
+        yield "result", data
+
+
+    async def generate_group_roast(
+        self, members: dict[str, MusicData], comparison: GroupComparison | None, use_cache: bool = True
+    ) -> tuple[dict[str, dict], dict | None]:
         """
-        
+        Roasts every member and, given a comparison, the group as a whole. Member roasts are
+        packed GEMINI_PACK_SIZE to an LLM call (the group roast rides along with the first) and
+        the calls run concurrently. Members with a cached roast are not sent, and fresh member
+        roasts are cached under the same key as generate_roast, so single roasts reuse them.
+        A member the model skipped or garbled, or a call that failed or missed the deadline,
+        gets the template roast.
+        Returns (member name -> dict shaped like generate_roast's, group dict with title,
+        roast and source or None without a comparison).
+        """
+        keys = {name: roast_cache_key(music_data) for name, music_data in members.items()}
+        group_key = group_roast_cache_key(keys) if comparison is not None else None
+        results: dict[str, dict] = {}
+        group = None
+        if use_cache:
+            cached = await self.cache.get_many([*keys.values(), *([group_key] if group_key else [])])
+            for name, key in keys.items():
+                if key in cached:
+                    LLM_REQUESTS.inc(outcome="cache_hit")
+                    results[name] = {**copy.deepcopy(cached[key]), "source": "cache"}
+            if group_key in cached:
+                group = {**copy.deepcopy(cached[group_key]), "source": "cache"}
+
+        # Members with the same profile (e.g. one token listed twice) share one roast
+        pending, seen = [], set()
+        for name in members:
+            if name not in results and keys[name] not in seen:
+                seen.add(keys[name])
+                pending.append(name)
+        packs = [pending[i:i + GEMINI_PACK_SIZE] for i in range(0, len(pending), GEMINI_PACK_SIZE)]
+        wants_group = comparison is not None and group is None
+        if wants_group and not packs:
+            packs = [[]]
+        outputs = await asyncio.gather(*(
+            self._roast_pack({f"m{i}": members[name] for i, name in enumerate(pack, 1)}, comparison if wants_group and n == 0 else None)
+            for n, pack in enumerate(packs)
+        ))
+
+        fresh = {}
+        for n, (pack, data) in enumerate(zip(packs, outputs)):
+            answers = {a.get("id"): a for a in data["members"] if isinstance(a, dict)} if data else {}
+            for i, name in enumerate(pack, 1):
+                answer = answers.get(f"m{i}")
+                if isinstance(answer, dict) and isinstance(answer.get("roast"), str):
+                    answer = {k: v for k, v in answer.items() if k != "id"}
+                    LLM_REQUESTS.inc(outcome="success")
+                    fresh[keys[name]] = copy.deepcopy(answer)
+                    results[name] = {**answer, "source": "llm"}
+                else:
+                    LLM_REQUESTS.inc(outcome="deadline" if data is False else "fallback")
+                    results[name] = {**template_roast(members[name]), "source": "template"}
+            if wants_group and n == 0:
+                answer = data.get("group") if data else None
+                if isinstance(answer, dict) and isinstance(answer.get("roast"), str):
+                    fresh[group_key] = copy.deepcopy(answer)
+                    group = {**answer, "source": "llm"}
+        for name in members:
+            if name not in results:
+                twin = next(n for n in pending if keys[n] == keys[name])
+                results[name] = copy.deepcopy(results[twin])
+        if wants_group and group is None:
+            group = {**template_group_roast(comparison), "source": "template"}
+        if fresh:
+            await self.cache.set_many(fresh)
+        return results, group
+
+    async def _roast_pack(self, members: dict[str, MusicData], comparison: GroupComparison | None) -> dict | bool | None:
+        """One packed LLM call: the parsed answer, False when the deadline ran out, None when it failed."""
+        budget = time_left(ROAST_DEADLINE_MARGIN)
+        if budget is not None and budget <= 0:
+            return False
+        prompt, dropped = group_user_prompt(members, comparison)
+        if dropped:
+            PROMPT_ITEMS_TRIMMED.inc(dropped, prompt=GROUP_PROMPT.name)
         try:
-            response = self.model.generate_content(prompt)
-            # Clean response if it contains markdown code blocks
-            clean_text = response.text.replace('```json', '').replace('```', '').strip()
-            import json
-            data = json.loads(clean_text)
-            
-            print(f"[Gemini] Generated success: Persona='{data.get('persona')}'")
+            outputs = len(members) + (comparison is not None)
+            response = await asyncio.wait_for(self._generate_hedged(GROUP_PROMPT, prompt, outputs), budget)
+            data = parse_json_object(response.text, "members", list)
+            if data is None:
+                LLM_PARSE_FAILURES.inc(prompt=GROUP_PROMPT.name)
+                raise ValueError(f"Model returned unparseable output: {response.text[:200]!r}")
+            logger.info("Packed roasts generated", extra={"members": len(members), "group": comparison is not None})
             return data
+        except asyncio.TimeoutError:
+            logger.warning("Roast deadline reached, using templates", extra={**_budget_extra(budget), "members": len(members)})
+            return False
         except Exception as e:
-            print(f"[Gemini] ERROR: {type(e).__name__}: {e}")
-            # Fallback
-            return {
-                "roast": f"Your top artist is {music_data.top_artists[0].name if music_data.top_artists else 'unknown'}? That's rough. Even our AI couldn't handle the cringe. 💀",
-                "persona": "Basic Music Consumer"
-            }
+            logger.error("Packed roast generation failed, using templates", extra={"error": f"{type(e).__name__}: {e}"})
+            return None
+
+
+def _budget_extra(budget: float | None) -> dict:
+    # No budget (ROAST_DEADLINE_SECONDS=0) means the timeout came from below, e.g. the HTTP client
+    return {"budget_s": round(budget, 3)} if budget is not None else {}
+
+
+def roast_cache_key(music_data: MusicData) -> str:
+    """
+    Canonical hash of everything the prompt is built from. The taste score is bucketed
+    (ROAST_CACHE_SCORE_BUCKET points wide) so near-identical profiles share a roast.
+    """
+    bucket = max(1, int(os.getenv("ROAST_CACHE_SCORE_BUCKET", "5")))
+    payload = {
+        "artists": [a.name for a in music_data.top_artists[:5]],
+        "tracks": [f"{t.name} by {t.artist_names[0] if t.artist_names else ''}" for t in music_data.top_tracks[:5]],
+        "genres": music_data.dominating_genres,
+        "score_bucket": music_data.taste_score // bucket,
+        "traits": music_data.roast_traits,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def group_roast_cache_key(member_keys: dict[str, str]) -> str:
+    """The group roast depends on who is in the group (names included) and on their profiles."""
+    canonical = json.dumps(sorted(member_keys.items()), separators=(",", ":"), ensure_ascii=False)
+    return "group:" + hashlib.sha256(canonical.encode()).hexdigest()
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def parse_roast_json(text: str) -> dict | None:
+    """
+    Parses the model's JSON answer, tolerating markdown fences and chatter around the object.
+    Returns None if no JSON object with a "roast" key can be found.
+    """
+    return parse_json_object(text, "roast", str)
+
+
+def parse_json_object(text: str, required_key: str, value_type: type = str) -> dict | None:
+    """
+    The first JSON object in `text` whose `required_key` holds a `value_type`, or None.
+    Structured-output answers are plain JSON and parse on the first try. Otherwise
+    markdown fences and chatter around the object are skipped: each "{" in turn is decoded
+    as exactly one object, so text after it is ignored but the object itself must be valid.
+    """
+    def usable(data) -> bool:
+        return isinstance(data, dict) and isinstance(data.get(required_key), value_type)
+
+    try:
+        data = json.loads(text)
+        if usable(data):
+            return data
+    except json.JSONDecodeError:
+        pass
+    start = text.find("{")
+    while start != -1:
+        try:
+            data, _ = _JSON_DECODER.raw_decode(text, start)
+            if usable(data):
+                return data
+        except json.JSONDecodeError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+class RoastTextExtractor:
+    """
+    Pulls the value of the "roast" field out of a JSON document that arrives in pieces,
+    so the text can be shown before the whole object (and the JSON) is complete.
+    """
+
+    _KEY = re.compile(r'"roast"\s*:\s*"')
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.buffer = ""
+        self.text = ""
+        self._pos: int | None = None  # index of the next undecoded char inside the string
+        self.done = False
+
+    def feed(self, piece: str) -> str:
+        """Adds a chunk of model output and returns the newly decoded roast text."""
+        self.buffer += piece
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self._KEY.search(self.buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        out = []
+        buf, i = self.buffer, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != '\\':
+                out.append(ch)
+                i += 1
+                continue
+            # Escape sequence: wait for the rest of it if the chunk ended mid-escape
+            if i + 1 >= len(buf):
+                break
+            esc = buf[i + 1]
+            if esc == 'u':
+                if i + 6 > len(buf):
+                    break
+                try:
+                    code = int(buf[i + 2:i + 6], 16)
+                except ValueError:
+                    code = None
+                if code is not None and 0xD800 <= code < 0xDC00:
+                    # High surrogate: emit it together with its low half (e.g. emoji)
+                    if i + 12 > len(buf):
+                        break
+                    if buf[i + 6:i + 8] == '\\u':
+                        try:
+                            low = int(buf[i + 8:i + 12], 16)
+                        except ValueError:
+                            low = 0
+                        if 0xDC00 <= low < 0xE000:
+                            out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                            i += 12
+                            continue
+                    code = None
+                if code is not None:
+                    out.append(chr(code))
+                i += 6
+            else:
+                out.append(self._ESCAPES.get(esc, esc))
+                i += 2
+        self._pos = i
+        delta = "".join(out)
+        self.text += delta
+        return delta
+
+
+_gemini_service: GeminiService | None = None
+
+def get_gemini_service() -> GeminiService:
+    global _gemini_service
+    if _gemini_service is None:
+        _gemini_service = GeminiService()
+    return _gemini_service
+
+
+def _llm_slot_samples() -> dict:
+    if _gemini_service is None:
+        return {}
+    return {("in_flight",): _gemini_service.in_flight, ("waiting",): _gemini_service.waiting,
+            ("limit",): _gemini_service.max_concurrency}
+
+gauge("roastmytune_llm_slots", "Gemini concurrency slots in use, callers waiting, and the limit", ["state"], fn=_llm_slot_samples)
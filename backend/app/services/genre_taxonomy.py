@@ -0,0 +1,107 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_TAXONOMY_PATH = Path(__file__).resolve().parent.parent / "data" / "genre_taxonomy.json"
+
+
+@dataclass(frozen=True)
+class GenreInfo:
+    """What one genre string means for scoring: parent categories, score delta and era."""
+    categories: frozenset
+    score_delta: int
+    era: Optional[str]
+    era_rank: int  # lower wins when several genres imply an era
+
+
+class GenreTaxonomy:
+    """
+    Maps Spotify micro-genres to parent categories, traits and eras.
+    A genre listed in the taxonomy's `genres` table gets exactly the categories listed for it;
+    the substring patterns are not applied to it (so "hyperpop": ["cool"] is not also "basic"
+    through "pop"). Any other genre matches every category with a `contains` pattern that is a
+    substring of it. An entry that only repeats what the patterns already give is rejected.
+    Category order in the file is meaningful: it is the order traits are emitted in and the era priority.
+    Each distinct genre string is classified once and then served from a lookup table.
+    """
+
+    def __init__(self, spec: dict):
+        self.categories: List[dict] = spec["categories"]
+        self._matchers = [
+            (c["name"], re.compile("|".join(re.escape(p.lower()) for p in c.get("contains", []))))
+            for c in self.categories if c.get("contains")
+        ]
+        self._exact: Dict[str, frozenset] = {
+            genre.lower(): frozenset(parents) for genre, parents in spec.get("genres", {}).items()
+        }
+        self._score = {c["name"]: c.get("score", 0) for c in self.categories}
+        self._eras = [(c["name"], c["era"]) for c in self.categories if c.get("era")]
+        self.era_labels = [label for _, label in self._eras]  # indexed by GenreInfo.era_rank
+        self.trait_order = [(c["name"], c["trait"]) for c in self.categories if c.get("trait")]
+        self._index: Dict[str, GenreInfo] = {}
+
+        known = set(self._score)
+        unknown = {p for parents in self._exact.values() for p in parents} - known
+        if unknown:
+            raise ValueError(f"Genre taxonomy maps genres to unknown categories: {sorted(unknown)}")
+        redundant = sorted(genre for genre, parents in self._exact.items() if parents == self._pattern_matches(genre))
+        if redundant:
+            raise ValueError(f"Genre taxonomy entries change nothing over the substring patterns: {redundant}")
+
+    @classmethod
+    def load(cls, path: str | Path = DEFAULT_TAXONOMY_PATH) -> "GenreTaxonomy":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def classify(self, genre: str) -> GenreInfo:
+        info = self._index.get(genre)
+        if info is None:
+            info = self._classify(genre)
+            self._index[genre] = info
+        return info
+
+    def _pattern_matches(self, lowered: str) -> frozenset:
+        return frozenset(name for name, pattern in self._matchers if pattern.search(lowered))
+
+    def _classify(self, genre: str) -> GenreInfo:
+        lowered = genre.lower()
+        matched = self._exact.get(lowered)
+        if matched is None:
+            matched = self._pattern_matches(lowered)
+        era, era_rank = None, len(self._eras)
+        for rank, (name, label) in enumerate(self._eras):
+            if name in matched:
+                era, era_rank = label, rank
+                break
+        return GenreInfo(
+            categories=frozenset(matched),
+            score_delta=sum(self._score[name] for name in matched),
+            era=era,
+            era_rank=era_rank,
+        )
+
+    def traits_for(self, infos: Iterable[GenreInfo]) -> List[str]:
+        """Traits implied by a set of genres, in taxonomy order and without duplicates."""
+        matched = set().union(*(info.categories for info in infos))
+        traits = []
+        for name, trait in self.trait_order:
+            if name in matched and trait not in traits:
+                traits.append(trait)
+        return traits
+
+    def era_for(self, infos: Iterable[GenreInfo]) -> Optional[str]:
+        best = min(infos, key=lambda info: info.era_rank, default=None)
+        return best.era if best is not None else None
+
+
+_taxonomy: GenreTaxonomy | None = None
+
+def get_genre_taxonomy() -> GenreTaxonomy:
+    """The app-wide taxonomy, compiled once. GENRE_TAXONOMY_PATH points at a custom file."""
+    global _taxonomy
+    if _taxonomy is None:
+        _taxonomy = GenreTaxonomy.load(os.getenv("GENRE_TAXONOMY_PATH") or DEFAULT_TAXONOMY_PATH)
+    return _taxonomy
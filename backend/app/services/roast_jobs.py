@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from app.core.cache import TTLCache
+from app.core.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENTS = counter("roastmytune_roast_jobs_total", "Roast jobs by lifecycle event", ["event"])
+
+ROAST_JOB_WORKERS = int(os.getenv("ROAST_JOB_WORKERS", "8"))
+ROAST_JOB_QUEUE_DEPTH = int(os.getenv("ROAST_JOB_QUEUE_DEPTH", "200"))
+ROAST_JOB_TTL = float(os.getenv("ROAST_JOB_TTL_SECONDS", "3600"))
+# "memory" (default, per process) or "sql" (the DATABASE_URL database, shared by every worker process)
+ROAST_JOB_STORE = os.getenv("ROAST_JOB_STORE", "memory").lower()
+
+
+class QueueFull(Exception):
+    """Too many jobs are waiting; `retry_after` estimates when a slot frees up."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Roast queue is full")
+        self.retry_after = retry_after
+
+
+@dataclass
+class RoastJob:
+    id: str
+    user_id: str
+    status: str = "queued"  # queued -> running -> done | failed
+    result: Dict[str, Any] | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+class InMemoryJobStore:
+    """Jobs in a TTL cache. Only the process that accepted a job can answer for it."""
+
+    def __init__(self, ttl: float = ROAST_JOB_TTL, max_jobs: int = 100_000):
+        self._jobs = TTLCache(max_entries=max_jobs, ttl=ttl)
+
+    async def start(self):
+        pass
+
+    async def save(self, job: RoastJob):
+        self._jobs.set(job.id, job)
+
+    async def get(self, job_id: str) -> RoastJob | None:
+        return self._jobs.get(job_id)
+
+
+class SqlJobStore:
+    """
+    Jobs in a `roast_jobs` table on the app database (app/core/database.py), so any process
+    can answer a poll. SQLAlchemy and the database module are only imported when this store
+    is selected. Rows older than the TTL are ignored on read and deleted by save(), at most
+    once per `prune_interval` seconds in each process.
+    """
+
+    def __init__(self, ttl: float = ROAST_JOB_TTL, prune_interval: float = 60.0):
+        import sqlalchemy as sa
+
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+        self._table = sa.Table(
+            "roast_jobs",
+            sa.MetaData(),
+            sa.Column("id", sa.String(32), primary_key=True),
+            sa.Column("user_id", sa.String(64), nullable=False, index=True),
+            sa.Column("status", sa.String(16), nullable=False),
+            sa.Column("result", sa.JSON, nullable=True),
+            sa.Column("error", sa.Text, nullable=True),
+            sa.Column("created_at", sa.Float, nullable=False, index=True),
+            sa.Column("updated_at", sa.Float, nullable=False),
+        )
+
+    async def start(self):
+        from app.core.database import get_engine
+
+        self._engine = get_engine()
+        async with self._engine.begin() as conn:
+            await conn.run_sync(self._table.metadata.create_all)
+
+    async def save(self, job: RoastJob):
+        values = asdict(job)
+        async with self._engine.begin() as conn:
+            updated = await conn.execute(
+                self._table.update().where(self._table.c.id == job.id).values(**values)
+            )
+            if updated.rowcount == 0:
+                await conn.execute(self._table.insert().values(**values))
+            if time.monotonic() - self._pruned_at >= self.prune_interval:
+                self._pruned_at = time.monotonic()
+                expired = await conn.execute(
+                    self._table.delete().where(self._table.c.created_at < time.time() - self.ttl)
+                )
+                if expired.rowcount:
+                    JOB_EVENTS.inc(expired.rowcount, event="expired")
+
+    async def get(self, job_id: str) -> RoastJob | None:
+        async with self._engine.connect() as conn:
+            row = (await conn.execute(
+                self._table.select().where(self._table.c.id == job_id)
+            )).mappings().first()
+        if row is None or row["created_at"] < time.time() - self.ttl:
+            return None
+        return RoastJob(**row)
+
+
+_queues: list["RoastJobQueue"] = []
+
+
+def build_job_store():
+    if ROAST_JOB_STORE == "sql":
+        return SqlJobStore()
+    if ROAST_JOB_STORE != "memory":
+        raise ValueError(f"Unknown ROAST_JOB_STORE {ROAST_JOB_STORE!r} (expected memory or sql)")
+    return InMemoryJobStore()
+
+
+class RoastJobQueue:
+    """
+    Accepts roast work immediately and runs it on a fixed pool of async workers, so LLM
+    latency no longer holds HTTP connections open. The queue is bounded: once
+    `max_depth` jobs are waiting, submit() raises QueueFull instead of buffering more.
+    A user submitting the same work again while it is pending gets the existing job back.
+
+    `runner(payload)` does the actual work and returns a JSON-able dict.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        workers: int = ROAST_JOB_WORKERS,
+        max_depth: int = ROAST_JOB_QUEUE_DEPTH,
+        store=None,
+    ):
+        self.runner = runner
+        self.worker_count = workers
+        self.max_depth = max_depth
+        self.store = store
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self._pending_keys: Dict[Hashable, str] = {}
+        self._running = 0
+        self._reserved = 0
+        self._recent_run_s = 1.0  # moving average, used for Retry-After estimates
+        _queues.append(self)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def stats(self) -> dict:
+        return {"depth": self.depth, "running": self._running, "workers": len(self._workers), "max_depth": self.max_depth}
+
+    async def start(self):
+        if self._workers:
+            return
+        if self.store is None:
+            self.store = build_job_store()
+        await self.store.start()
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Jobs that never started would otherwise stay "queued" in a shared store forever
+        while self._queue is not None and not self._queue.empty():
+            job, _, _ = self._queue.get_nowait()
+            job.status, job.error, job.updated_at = "failed", "Server shutting down", time.time()
+            await self.store.save(job)
+
+    async def submit(self, user_id: str, payload: Dict[str, Any], dedupe_key: Hashable | None = None) -> RoastJob:
+        if self._queue is None:
+            raise RuntimeError("RoastJobQueue.start() has not been called")
+        if dedupe_key is not None and dedupe_key in self._pending_keys:
+            existing = await self.store.get(self._pending_keys[dedupe_key])
+            if existing is not None and not existing.finished:
+                JOB_EVENTS.inc(event="deduplicated")
+                return existing
+
+        # Slots are reserved before the (possibly slow) store write so concurrent submits can't overfill
+        if self._queue.qsize() + self._reserved >= self.max_depth:
+            raise self._rejected()
+
+        job = RoastJob(id=uuid.uuid4().hex, user_id=user_id)
+        self._reserved += 1
+        try:
+            await self.store.save(job)
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait((job, payload, dedupe_key))
+        self._done_events[job.id] = asyncio.Event()
+        if dedupe_key is not None:
+            self._pending_keys[dedupe_key] = job.id
+        JOB_EVENTS.inc(event="queued")
+        return job
+
+    def _rejected(self) -> QueueFull:
+        JOB_EVENTS.inc(event="rejected")
+        waves = self.depth / max(1, self.worker_count)
+        return QueueFull(retry_after=max(1.0, waves * self._recent_run_s))
+
+    async def get(self, job_id: str, wait: float = 0.0) -> RoastJob | None:
+        """Current job state; with `wait`, long-polls until the job finishes or the wait is over."""
+        job = await self.store.get(job_id)
+        if job is None or job.finished or wait <= 0:
+            return job
+        event = self._done_events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            return await self.store.get(job_id)
+        # Accepted by another process (shared store), or finished just now: poll the store
+        deadline = time.monotonic() + wait
+        while True:
+            job = await self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job.finished or remaining <= 0:
+                return job
+            await asyncio.sleep(min(0.5, remaining))
+
+    async def _worker(self, index: int):
+        while True:
+            job, payload, dedupe_key = await self._queue.get()
+            self._running += 1
+            started = time.perf_counter()
+            try:
+                job.status, job.updated_at = "running", time.time()
+                await self.store.save(job)
+                try:
+                    job.result = await self.runner(payload)
+                    job.status = "done"
+                    JOB_EVENTS.inc(event="done")
+                except asyncio.CancelledError:
+                    job.status, job.error = "failed", "Server shutting down"
+                    raise
+                except Exception as e:
+                    logger.exception("Roast job failed", extra={"job_id": job.id})
+                    job.status, job.error = "failed", str(e)
+                    JOB_EVENTS.inc(event="failed")
+                finally:
+                    job.updated_at = time.time()
+                    await asyncio.shield(self.store.save(job))
+            finally:
+                self._running -= 1
+                self._recent_run_s = 0.9 * self._recent_run_s + 0.1 * (time.perf_counter() - started)
+                if dedupe_key is not None and self._pending_keys.get(dedupe_key) == job.id:
+                    del self._pending_keys[dedupe_key]
+                event = self._done_events.pop(job.id, None)
+                if event is not None:
+                    event.set()
+                self._queue.task_done()
+
+
+gauge(
+    "roastmytune_roast_job_queue",
+    "Roast job queue: jobs waiting, jobs running, worker count, depth limit",
+    ["stat"],
+    fn=lambda: {(name,): sum(q.stats[name] for q in _queues) for name in ("depth", "running", "workers", "max_depth")},
+)
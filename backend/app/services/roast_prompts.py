@@ -0,0 +1,227 @@
+import inspect
+import math
+import os
+import string
+from typing import Any, Callable, Dict, List
+from app.schemas.music import GroupComparison, MusicData
+
+# Rough size of a Gemini token in characters of English text; close enough for budgeting
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+# Tokens allowed for one user's data in a prompt (and for the group section of a group prompt)
+PROMPT_PROFILE_TOKEN_BUDGET = int(os.getenv("PROMPT_PROFILE_TOKEN_BUDGET", "200"))
+# Longer artist/track/genre names are cut to this many characters
+PROMPT_MAX_ITEM_CHARS = int(os.getenv("PROMPT_MAX_ITEM_CHARS", "60"))
+# Output cap per roast; a packed call gets one per member (+1 for the group roast)
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "512"))
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / PROMPT_CHARS_PER_TOKEN))
+
+
+class PromptTemplate:
+    """
+    A prompt split into static instructions and a small user template. The instructions
+    are built once, at import, and sent as the model's system instruction; per call only
+    the template's $slots are filled in. `response_schema` (a JSON schema) is what the
+    model is asked to answer with when structured output is on.
+    """
+
+    def __init__(self, name: str, system_instruction: str, user_template: str, response_schema: Dict[str, Any]):
+        self.name = name
+        self.system_instruction = inspect.cleandoc(system_instruction)
+        self.user_template = string.Template(inspect.cleandoc(user_template))
+        self.response_schema = response_schema
+        self.system_tokens = estimate_tokens(self.system_instruction)
+
+    def render(self, **slots) -> str:
+        return self.user_template.substitute(slots)
+
+    def generation_config(self, max_output_tokens: int, structured: bool = True) -> Dict[str, Any]:
+        config: Dict[str, Any] = {"max_output_tokens": max_output_tokens}
+        if structured:
+            config.update(response_mime_type="application/json", response_schema=self.response_schema)
+        return config
+
+
+def fit_to_budget(render: Callable[[Dict[str, List[str]]], str], lists: Dict[str, List[str]], budget: int) -> tuple[str, int]:
+    """
+    Renders `lists` (slot -> items) with `render`, dropping items from the end of the list
+    holding the most text until the estimate fits `budget` tokens. Lists keep at least their
+    first item, so the result can stay over budget. Returns (text, items dropped).
+    """
+    lists = {slot: [_clip(item) for item in items] for slot, items in lists.items()}
+    dropped = 0
+    while True:
+        text = render(lists)
+        if estimate_tokens(text) <= budget:
+            return text, dropped
+        slot = max(lists, key=lambda s: (len(lists[s]) > 1, sum(len(item) for item in lists[s])))
+        if len(lists[slot]) <= 1:
+            return text, dropped
+        lists[slot] = lists[slot][:-1]
+        dropped += 1
+
+
+def _clip(item: str) -> str:
+    return item if len(item) <= PROMPT_MAX_ITEM_CHARS else item[:PROMPT_MAX_ITEM_CHARS - 1] + "…"
+
+
+_ROAST_FIELDS = {
+    "roast": {"type": "string"},
+    "persona": {"type": "string"},
+    "era": {
+        "type": "object",
+        "properties": {"title": {"type": "string"}, "description": {"type": "string"}},
+        "required": ["title", "description"],
+    },
+    "hogwarts_house": {
+        "type": "object",
+        "properties": {"house": {"type": "string"}, "reason": {"type": "string"}},
+        "required": ["house", "reason"],
+    },
+}
+
+_CRITIC = """
+    You are a mean, brutal, Gen-Z music critic. Your job is to ROAST the user's music taste and assign them a specific, funny archetypal PERSONA.
+"""
+
+_TASKS = """
+    1. **ROAST**: Write a short, biting paragraph (3-4 sentences) directly addressing the user. Mention specific artists. Be ruthless.
+    2. **PERSONA**: Give them a short, funny 3-5 word title describing their vibe (e.g., "Sad 2014 Indie Kid", "Gas Station Drake Fan").
+    3. **ERA**: Tell them what year they are mentally stuck in. Provide a Title (e.g. "2016 SoundCloud Rap Era") and a short Description.
+    4. **HOGWARTS HOUSE**: Sort them into a Harry Potter House based *solely* on music vibe. Provide the House Name and a snarky 1-sentence Reason.
+"""
+
+ROAST_PROMPT = PromptTemplate(
+    "roast",
+    _CRITIC + """
+    INSTRUCTIONS:""" + _TASKS + """
+    FORMAT:
+    Return ONLY valid JSON with no markdown formatting.
+    {"roast": "...", "persona": "...", "era": {"title": "...", "description": "..."}, "hogwarts_house": {"house": "...", "reason": "..."}}
+    """,
+    """
+    USER DATA:
+    - Top Artists: $artists
+    - Top Tracks: $tracks
+    - Top Genres: $genres
+    - Taste Score: $score/100 (Lower is more "basic")
+    - Traits: $traits
+    """,
+    {"type": "object", "properties": _ROAST_FIELDS, "required": list(_ROAST_FIELDS)},
+)
+
+GROUP_PROMPT = PromptTemplate(
+    "group",
+    _CRITIC + """
+    The message lists several users, each under an id like [m1].
+
+    INSTRUCTIONS, for EVERY user:""" + _TASKS + """
+    If the message has a GROUP section, the users are friends comparing their taste: also write a short,
+    biting group roast (3-4 sentences) calling members out by name, and a funny 3-6 word group TITLE.
+
+    FORMAT:
+    Return ONLY valid JSON with no markdown formatting, with one entry per user id ("group" only when asked for).
+    {"members": [{"id": "m1", "roast": "...", "persona": "...", "era": {"title": "...", "description": "..."}, "hogwarts_house": {"house": "...", "reason": "..."}}], "group": {"title": "...", "roast": "..."}}
+    """,
+    """
+    USERS:
+    $members
+    $group
+    """,
+    {
+        "type": "object",
+        "properties": {
+            "members": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"id": {"type": "string"}, **_ROAST_FIELDS},
+                    "required": ["id", *_ROAST_FIELDS],
+                },
+            },
+            "group": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "roast": {"type": "string"}},
+                "required": ["title", "roast"],
+            },
+        },
+        "required": ["members"],
+    },
+)
+
+_PROFILE = string.Template(inspect.cleandoc("""
+    - Top Artists: $artists
+    - Top Tracks: $tracks
+    - Top Genres: $genres
+    - Taste Score: $score/100 (Lower is more "basic")
+    - Traits: $traits
+"""))
+
+_GROUP = string.Template(inspect.cleandoc("""
+    GROUP: average score $average/100; most basic: $most_basic; most obscure: $most_obscure
+    - Shared Artists: $artists
+    - Shared Genres: $genres
+    - Compatibility: $matches
+"""))
+
+
+def _profile_lists(music_data: MusicData) -> Dict[str, List[str]]:
+    return {
+        "artists": [a.name for a in music_data.top_artists[:5]],
+        "tracks": [f"{t.name} by {t.artist_names[0]}" for t in music_data.top_tracks[:5] if t.artist_names],
+        "genres": list(music_data.dominating_genres),
+        "traits": list(music_data.roast_traits),
+    }
+
+
+def _render_profile(template: string.Template, music_data: MusicData, lists: Dict[str, List[str]]) -> str:
+    return template.substitute(
+        artists=", ".join(lists["artists"]) or "unknown",
+        tracks=", ".join(lists["tracks"]) or "unknown",
+        genres=", ".join(lists["genres"]) or "unknown",
+        score=music_data.taste_score,
+        traits=", ".join(lists["traits"]) or "mysterious",
+    )
+
+
+def roast_user_prompt(music_data: MusicData, budget: int = PROMPT_PROFILE_TOKEN_BUDGET) -> tuple[str, int]:
+    """The variable part of a single roast prompt, trimmed to `budget` tokens; (text, items dropped)."""
+    return fit_to_budget(
+        lambda lists: _render_profile(ROAST_PROMPT.user_template, music_data, lists), _profile_lists(music_data), budget
+    )
+
+
+def group_user_prompt(
+    members: Dict[str, MusicData], comparison: GroupComparison | None, budget: int = PROMPT_PROFILE_TOKEN_BUDGET
+) -> tuple[str, int]:
+    """
+    The variable part of a packed prompt: members keyed by pack id (e.g. "m1"), each trimmed
+    to `budget` tokens, and the group section (also `budget` tokens) when there is a comparison.
+    """
+    sections, dropped = [], 0
+    for pack_id, music_data in members.items():
+        text, n = fit_to_budget(lambda lists: _render_profile(_PROFILE, music_data, lists), _profile_lists(music_data), budget)
+        sections.append(f"[{pack_id}]\n{text}")
+        dropped += n
+    group = ""
+    if comparison is not None:
+        group, n = fit_to_budget(
+            lambda lists: _GROUP.substitute(
+                average=f"{comparison.average_taste_score:g}",
+                most_basic=comparison.most_basic,
+                most_obscure=comparison.most_obscure,
+                artists=", ".join(lists["artists"]) or "none",
+                genres=", ".join(lists["genres"]) or "none",
+                matches="; ".join(lists["matches"]),
+            ),
+            {
+                "artists": comparison.shared_artists,
+                "genres": comparison.shared_genres,
+                "matches": [f"{' & '.join(m.members)} {m.compatibility}%" for m in comparison.matches],
+            },
+            budget,
+        )
+        dropped += n
+    return GROUP_PROMPT.render(members="\n".join(sections), group=group).strip(), dropped
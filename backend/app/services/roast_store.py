@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+from app.core.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+ROAST_WRITES = counter("roastmytune_roast_writes_total", "Roast rows by write-behind outcome", ["outcome"])
+ROAST_WRITE_BATCHES = counter("roastmytune_roast_write_batches_total", "Write-behind flushes (one INSERT each)")
+
+# Roasts are saved whenever a database is configured, unless ROAST_PERSISTENCE=off
+PERSISTENCE_ENABLED = bool(os.getenv("DATABASE_URL")) and os.getenv("ROAST_PERSISTENCE", "on").lower() != "off"
+ROAST_WRITE_BATCH_SIZE = int(os.getenv("ROAST_WRITE_BATCH_SIZE", "100"))
+ROAST_WRITE_FLUSH_INTERVAL = float(os.getenv("ROAST_WRITE_FLUSH_INTERVAL", "0.5"))
+ROAST_WRITE_MAX_PENDING = int(os.getenv("ROAST_WRITE_MAX_PENDING", "10000"))
+# How long startup waits for the database before going on without persistence
+ROAST_STORE_START_TIMEOUT = float(os.getenv("ROAST_STORE_START_TIMEOUT_SECONDS", "10"))
+
+# Ids: milliseconds since 2024-01-01 in the high 41 bits (so ids sort by creation time, which
+# history pagination relies on) and 22 random bits, 63 in total. Every worker and host mints
+# ids on its own; two only clash if they land on the same millisecond and the same random bits.
+_ID_EPOCH_MS = 1704067200000
+
+
+def new_roast_id() -> int:
+    ms = int(time.time() * 1000) - _ID_EPOCH_MS
+    return ((ms & ((1 << 41) - 1)) << 22) | secrets.randbits(22)
+
+
+class RoastWriter:
+    """
+    Write-behind persistence for roasts. save() only assigns an id and queues the row, so
+    responses never wait on the database; a background task inserts queued rows in batches
+    (up to `batch_size` rows, or whatever arrived within `flush_interval`). Rows still in the
+    queue are served by get() too. If the queue is full, new rows are dropped (and counted)
+    rather than held in memory without bound.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = ROAST_WRITE_BATCH_SIZE,
+        flush_interval: float = ROAST_WRITE_FLUSH_INTERVAL,
+        max_pending: int = ROAST_WRITE_MAX_PENDING,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Rows not flushed yet, by id and by share token; lookups check these first
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._pending_shared: Dict[str, Dict[str, Any]] = {}
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        from app.core.database import get_engine
+        from app.models.models import Roast
+
+        self._engine = get_engine()
+        self._table = Roast.__table__
+        async with self._engine.begin() as conn:
+            await conn.run_sync(self._table.metadata.create_all, tables=[self._table])
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Flushes what is queued (for up to drain_timeout seconds), then stops the flusher."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Roast writer stopped with rows still queued", extra={"rows": self._queue.qsize()})
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def save(self, user_id: str, roast: Dict[str, Any]) -> Tuple[int, str] | None:
+        """
+        Queues a roast (RoastResponse fields) for insertion and returns its (id, share_token),
+        or None if dropped.
+        """
+        if len(self._pending) >= self.max_pending:
+            ROAST_WRITES.inc(outcome="dropped")
+            return None
+        roast_id = new_roast_id()
+        while roast_id in self._pending:
+            roast_id = new_roast_id()
+        row = {
+            "id": roast_id,
+            "user_id": user_id,
+            "share_token": secrets.token_urlsafe(16),
+            "roast_text": roast["roast_text"],
+            "persona": roast.get("persona"),
+            "era": roast.get("era"),
+            "hogwarts_house": roast.get("hogwarts_house"),
+            "taste_score": roast["taste_score"],
+            "roast_traits": roast.get("roast_traits"),
+            "music_data_snapshot": roast.get("music_data"),
+            "source": roast.get("source"),
+            "created_at": datetime.now(timezone.utc),
+        }
+        self._pending[row["id"]] = row
+        self._pending_shared[row["share_token"]] = row
+        self._queue.put_nowait(row)
+        ROAST_WRITES.inc(outcome="queued")
+        return row["id"], row["share_token"]
+
+    async def _flush_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            flush_at = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            finally:
+                for row in batch:
+                    self._pending.pop(row["id"], None)
+                    self._pending_shared.pop(row["share_token"], None)
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[Dict[str, Any]], attempts: int = 3):
+        from sqlalchemy.exc import IntegrityError
+
+        for attempt in range(attempts):
+            try:
+                async with self._engine.begin() as conn:
+                    await conn.execute(self._table.insert(), batch)
+                ROAST_WRITE_BATCHES.inc()
+                ROAST_WRITES.inc(len(batch), outcome="written")
+                return
+            except IntegrityError:
+                # A retry would fail the same way; insert row by row so only the clashing row is lost
+                await self._write_rows(batch)
+                return
+            except Exception as e:
+                logger.warning("Roast batch insert failed", extra={"rows": len(batch), "attempt": attempt + 1, "error": str(e)})
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        ROAST_WRITES.inc(len(batch), outcome="failed")
+
+    async def _write_rows(self, batch: List[Dict[str, Any]]):
+        from sqlalchemy.exc import IntegrityError
+
+        for row in batch:
+            try:
+                async with self._engine.begin() as conn:
+                    await conn.execute(self._table.insert(), row)
+                ROAST_WRITES.inc(outcome="written")
+            except IntegrityError as e:
+                logger.error("Roast insert conflicted, row dropped", extra={"roast_id": row["id"], "error": str(e)})
+                ROAST_WRITES.inc(outcome="conflict")
+            except Exception as e:
+                logger.warning("Roast insert failed", extra={"roast_id": row["id"], "error": str(e)})
+                ROAST_WRITES.inc(outcome="failed")
+
+    async def get(self, roast_id: int) -> Dict[str, Any] | None:
+        row = self._pending.get(roast_id)
+        if row is not None:
+            return row
+        async with self._engine.connect() as conn:
+            result = await conn.execute(self._table.select().where(self._table.c.id == roast_id))
+            row = result.mappings().first()
+        return dict(row) if row else None
+
+    async def get_shared(self, share_token: str) -> Dict[str, Any] | None:
+        row = self._pending_shared.get(share_token)
+        if row is not None:
+            return row
+        async with self._engine.connect() as conn:
+            result = await conn.execute(self._table.select().where(self._table.c.share_token == share_token))
+            row = result.mappings().first()
+        return dict(row) if row else None
+
+    async def list_for_user(self, user_id: str, limit: int = 20, before_id: int | None = None) -> List[Dict[str, Any]]:
+        """A user's roasts, newest first; pass the last id seen as `before_id` for the next page."""
+        t = self._table
+        query = t.select().where(t.c.user_id == user_id)
+        if before_id is not None:
+            query = query.where(t.c.id < before_id)
+        # Ids sort by creation time (see new_roast_id), so they order and page the history alike
+        query = query.order_by(t.c.id.desc()).limit(limit)
+        async with self._engine.connect() as conn:
+            rows = [dict(r) for r in (await conn.execute(query)).mappings()]
+        # Not flushed yet, but already returned to the user
+        queued = [r for r in self._pending.values() if r["user_id"] == user_id and (before_id is None or r["id"] < before_id)]
+        seen = {r["id"] for r in rows}
+        merged = [r for r in queued if r["id"] not in seen] + rows
+        merged.sort(key=lambda r: r["id"], reverse=True)
+        return merged[:limit]
+
+
+_roast_writer: RoastWriter | None = None
+
+
+def get_roast_writer() -> RoastWriter | None:
+    """The running writer, or None when persistence is off (no DATABASE_URL)."""
+    return _roast_writer
+
+
+async def start_roast_writer():
+    """
+    Starts persistence when it is enabled. An unreachable or misconfigured database is
+    logged and leaves persistence off for this process; the app still starts.
+    """
+    global _roast_writer
+    if PERSISTENCE_ENABLED and _roast_writer is None:
+        writer = RoastWriter()
+        try:
+            await asyncio.wait_for(writer.start(), ROAST_STORE_START_TIMEOUT)
+        except Exception as e:
+            logger.error("Roast persistence unavailable, roasts will not be saved", extra={"error": f"{type(e).__name__}: {e}"})
+            return
+        _roast_writer = writer
+
+
+async def stop_roast_writer():
+    global _roast_writer
+    if _roast_writer is not None:
+        await _roast_writer.stop()
+        _roast_writer = None
+
+
+def save_roast(user_id: str, roast: Dict[str, Any]) -> Tuple[int, str] | None:
+    """Queues a roast for persistence if it is enabled; returns the roast's (id, share_token) or None."""
+    if _roast_writer is None:
+        return None
+    return _roast_writer.save(user_id, roast)
+
+
+gauge(
+    "roastmytune_roast_writer_pending",
+    "Roasts queued for the write-behind insert",
+    fn=lambda: {(): _roast_writer.pending} if _roast_writer else {},
+)
@@ -1,7 +1,36 @@
-from typing import List, Dict
-from app.schemas.music import MusicData, Track, Artist
+import heapq
+import logging
+import math
+from itertools import combinations
+from typing import List, Dict, Sequence
+from app.schemas.music import ExtendedMusicData, GroupComparison, MemberMatch, MusicData, TasteDrift, Track, Artist
+from app.services.genre_taxonomy import get_genre_taxonomy
 from collections import Counter
-import random
+import hashlib
+
+logger = logging.getLogger(__name__)
+
+
+# Popularity tiers, most mainstream first: (lower bound, traits); the last tier catches the rest
+POPULARITY_TIERS = [
+    (75, ["Basic", "NPC", "Billboard Bot"]),
+    (60, ["Mainstream-Adjacent", "Playlist Andy"]),
+    (40, ["Average", "Mid"]),
+    (20, ["Indie Kid", "Pretentious"]),
+    (None, ["Hipster", "Obscure AF", "Contrarian"]),
+]
+
+
+def profile_fingerprint(top_artists: List[Artist], top_tracks: List[Track]) -> str:
+    """Stable hash of a listening profile (ranked artist and track ids)."""
+    raw = ",".join(a.id for a in top_artists) + "|" + ",".join(t.id for t in top_tracks)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def score_jitter(fingerprint: str) -> int:
+    """The 'random' -5..+5 fun factor, seeded from the fingerprint so a profile always scores the same."""
+    return int(fingerprint[:16], 16) % 11 - 5
+
 
 class ScoringService:
     def calculate_score(self, top_artists: List[Artist], top_tracks: List[Track]) -> MusicData:
@@ -21,85 +50,73 @@ class ScoringService:
         # 1. Average Popularity (0-100 from Spotify)
         avg_pop_tracks = sum(t.popularity for t in top_tracks) / len(top_tracks)
         avg_pop_artists = sum(a.popularity for a in top_artists) / len(top_artists)
-        overall_pop = (avg_pop_tracks + avg_pop_artists) / 2
-        
-        print(f"[Scoring] Avg Track Popularity: {avg_pop_tracks:.1f}, Avg Artist Popularity: {avg_pop_artists:.1f}")
-        
+
         # 2. Dominating Genres
         all_genres = []
         for a in top_artists:
             all_genres.extend(a.genres)
         genre_counts = Counter(all_genres)
         top_genres = [g[0] for g in genre_counts.most_common(5)]
-        
-        print(f"[Scoring] Top Genres: {top_genres}")
-        
+
+        return self.build_music_data(
+            top_artists, top_tracks, avg_pop_artists, avg_pop_tracks, top_genres, len(genre_counts)
+        )
+
+    def build_music_data(
+        self,
+        top_artists: List[Artist],
+        top_tracks: List[Track],
+        avg_pop_artists: float,
+        avg_pop_tracks: float,
+        top_genres: List[str],
+        unique_genres: int,
+    ) -> MusicData:
+        """Score, traits and era from a profile's aggregates (shared with IncrementalScorer)."""
+        overall_pop = (avg_pop_tracks + avg_pop_artists) / 2
+
         # 3. Calculate Score
         # Base score: inverse of popularity (more mainstream = lower score)
         # Popularity of 50 = 50 score base, Popularity of 80 = 20 score base
         score = 100 - overall_pop
         
-        # Penalty for basic genres (max -15 pts)
-        basic_genres = ["pop", "dance pop", "edm", "top 40", "mainstream"]
-        for genre in top_genres:
-            if any(bg in genre.lower() for bg in basic_genres):
-                score -= 5
-                
-        # Bonus for "sophisticated" genres (max +15 pts)
-        cool_genres = ["jazz", "classical", "indie", "alternative", "metal", "punk", "folk"]
-        for genre in top_genres:
-            if any(cg in genre.lower() for cg in cool_genres):
-                score += 5
+        # Genre penalties/bonuses come from the taxonomy: "basic" genres -5, "sophisticated" +5
+        taxonomy = get_genre_taxonomy()
+        genre_infos = [taxonomy.classify(g) for g in top_genres]
+        score += sum(info.score_delta for info in genre_infos)
                 
         # Variety bonus: more unique genres = higher score
-        unique_genres = len(set(all_genres))
         if unique_genres > 15:
             score += 10
         elif unique_genres > 10:
             score += 5
             
-        # Add slight randomness for fun (-5 to +5)
-        score += random.randint(-5, 5)
+        # Add slight randomness for fun (-5 to +5), deterministic per profile
+        score += score_jitter(profile_fingerprint(top_artists, top_tracks))
         
         # Clamp to 0-100
         score = max(0, min(100, int(score)))
         
-        print(f"[Scoring] Final Score: {score}")
+        logger.debug("Scored profile", extra={
+            "avg_track_popularity": round(avg_pop_tracks, 1),
+            "avg_artist_popularity": round(avg_pop_artists, 1),
+            "top_genres": top_genres,
+            "score": score,
+        })
         
         # Traits generation based on data
         traits = []
         
         # Popularity-based traits
-        if overall_pop > 75:
-            traits.extend(["Basic", "NPC", "Billboard Bot"])
-        elif overall_pop > 60:
-            traits.extend(["Mainstream-Adjacent", "Playlist Andy"])
-        elif overall_pop > 40:
-            traits.extend(["Average", "Mid"])
-        elif overall_pop > 20:
-            traits.extend(["Indie Kid", "Pretentious"])
-        else:
-            traits.extend(["Hipster", "Obscure AF", "Contrarian"])
+        for threshold, tier_traits in POPULARITY_TIERS:
+            if threshold is None or overall_pop > threshold:
+                traits.extend(tier_traits)
+                break
             
         # Genre-based traits
-        if any("k-pop" in g.lower() for g in top_genres):
-            traits.append("Stan Account")
-        if any("metal" in g.lower() for g in top_genres):
-            traits.append("Edge Lord")
-        if any("country" in g.lower() for g in top_genres):
-            traits.append("Yeehaw")
-        if any("rap" in g.lower() or "hip hop" in g.lower() for g in top_genres):
-            traits.append("Bars Only")
-        if any("r&b" in g.lower() for g in top_genres):
-            traits.append("Smooth Operator")
-        if any("rock" in g.lower() for g in top_genres):
-            traits.append("Guitar Hero")
+        traits.extend(taxonomy.traits_for(genre_infos))
             
         # Musical Era
-        era = "Modern"
-        if any("80s" in g for g in top_genres): era = "80s Nostalgia"
-        elif any("90s" in g for g in top_genres): era = "90s Kid"
-        elif any("classic" in g.lower() for g in top_genres): era = "Boomer Energy"
+        era = taxonomy.era_for(genre_infos) or "Modern"
         
         return MusicData(
             top_artists=top_artists,
@@ -111,3 +128,195 @@ class ScoringService:
             taste_score=score,
             roast_traits=traits[:4]  # Limit to 4 traits
         )
+
+
+# Spotify's top-item windows, oldest last
+TIME_RANGES = ("short_term", "medium_term", "long_term")
+
+
+class _RangeState:
+    """Running aggregates for one time range. Items are keyed by their position in the range."""
+
+    def __init__(self):
+        self.artists: Dict[int, Artist] = {}
+        self.tracks: Dict[int, Track] = {}
+        self.artist_popularity = 0
+        self.track_popularity = 0
+        self.unique_artists = 0
+        self.unique_tracks = 0
+        self.genre_counts: Counter = Counter()
+        # genre -> (artist position, index in that artist's genres) of its first occurrence
+        self.genre_first: Dict[str, tuple] = {}
+        self.genre_norm2 = 0  # sum of squared genre counts
+
+
+class IncrementalScorer:
+    """
+    Scores several time ranges of one profile from pages folded in as they arrive, in any
+    order. Pages may overlap (Spotify's second 50-item page starts at offset 49); items are
+    keyed by position, so repeats are ignored.
+
+    Drift between ranges is kept up to date while folding: shared artist/track ids and the
+    dot product of every pair of genre-count vectors are adjusted per item, so comparing
+    ranges never walks their lists again. Results match ScoringService.calculate_score on
+    the same ranked lists, including the genre tie order (first occurrence wins).
+
+    The keys need not be time ranges: group roasts fold in one key per member (see compare_group).
+    """
+
+    def __init__(self, time_ranges: Sequence[str] = TIME_RANGES):
+        # Newest first, like TIME_RANGES
+        self.time_ranges = tuple(time_ranges)
+        self._ranges = {r: _RangeState() for r in self.time_ranges}
+        # id -> ranges it appears in, for the overlap counts
+        self._artist_ranges: Dict[str, set] = {}
+        self._track_ranges: Dict[str, set] = {}
+        self._shared: Counter = Counter()  # (kind, range, range) -> ids in both
+        self._genre_dot: Counter = Counter()  # (range, range) -> sum of count products
+
+    @staticmethod
+    def _pair(a: str, b: str) -> tuple:
+        return (a, b) if a < b else (b, a)
+
+    def _track_membership(self, kind: str, index: Dict[str, set], item_id: str, time_range: str) -> bool:
+        ranges = index.setdefault(item_id, set())
+        if time_range in ranges:
+            return False
+        for other in ranges:
+            self._shared[(kind, *self._pair(time_range, other))] += 1
+        ranges.add(time_range)
+        return True
+
+    def add_artists(self, time_range: str, offset: int, artists: List[Artist]):
+        state = self._ranges[time_range]
+        for i, artist in enumerate(artists, start=offset):
+            if i in state.artists:
+                continue
+            state.artists[i] = artist
+            state.artist_popularity += artist.popularity
+            if self._track_membership("artists", self._artist_ranges, artist.id, time_range):
+                state.unique_artists += 1
+            for j, genre in enumerate(artist.genres):
+                count = state.genre_counts[genre]
+                state.genre_counts[genre] = count + 1
+                state.genre_norm2 += 2 * count + 1
+                for other, other_state in self._ranges.items():
+                    if other != time_range and genre in other_state.genre_counts:
+                        self._genre_dot[self._pair(time_range, other)] += other_state.genre_counts[genre]
+                first = state.genre_first.get(genre)
+                if first is None or (i, j) < first:
+                    state.genre_first[genre] = (i, j)
+
+    def add_tracks(self, time_range: str, offset: int, tracks: List[Track]):
+        state = self._ranges[time_range]
+        for i, track in enumerate(tracks, start=offset):
+            if i in state.tracks:
+                continue
+            state.tracks[i] = track
+            state.track_popularity += track.popularity
+            if self._track_membership("tracks", self._track_ranges, track.id, time_range):
+                state.unique_tracks += 1
+
+    def score(self, time_range: str) -> MusicData | None:
+        """The range's MusicData, or None if it has no artists or no tracks."""
+        state = self._ranges[time_range]
+        if not state.artists or not state.tracks:
+            return None
+        artists = [state.artists[i] for i in sorted(state.artists)]
+        tracks = [state.tracks[i] for i in sorted(state.tracks)]
+        top_genres = heapq.nsmallest(
+            5, state.genre_counts, key=lambda g: (-state.genre_counts[g], state.genre_first[g])
+        )
+        return ScoringService().build_music_data(
+            artists,
+            tracks,
+            state.artist_popularity / len(artists),
+            state.track_popularity / len(tracks),
+            top_genres,
+            len(state.genre_counts),
+        )
+
+    def _jaccard(self, kind: str, a: str, b: str, size_a: int, size_b: int) -> float:
+        shared = self._shared[(kind, *self._pair(a, b))]
+        union = size_a + size_b - shared
+        return shared / union if union else 0.0
+
+    def similarity(self, a: str, b: str) -> tuple[float, float, float]:
+        """Artist and track overlap (Jaccard) and genre cosine similarity of two ranges."""
+        state_a, state_b = self._ranges[a], self._ranges[b]
+        norms = math.sqrt(state_a.genre_norm2 * state_b.genre_norm2)
+        return (
+            round(self._jaccard("artists", a, b, state_a.unique_artists, state_b.unique_artists), 4),
+            round(self._jaccard("tracks", a, b, state_a.unique_tracks, state_b.unique_tracks), 4),
+            round(self._genre_dot[self._pair(a, b)] / norms, 4) if norms else 0.0,
+        )
+
+    def drift(self, older: str, newer: str, scored: Dict[str, MusicData]) -> TasteDrift:
+        old_state, new_state = self._ranges[older], self._ranges[newer]
+        old_data, new_data = scored[older], scored[newer]
+        artist_overlap, track_overlap, genre_similarity = self.similarity(older, newer)
+        return TasteDrift(
+            from_range=older,
+            to_range=newer,
+            artist_overlap=artist_overlap,
+            track_overlap=track_overlap,
+            genre_similarity=genre_similarity,
+            popularity_change=round(new_data.average_popularity - old_data.average_popularity, 2),
+            score_change=new_data.taste_score - old_data.taste_score,
+            new_genres=[g for g in new_data.dominating_genres if g not in old_state.genre_counts],
+            dropped_genres=[g for g in old_data.dominating_genres if g not in new_state.genre_counts],
+        )
+
+    def result(self) -> ExtendedMusicData:
+        """Scores every range that has data and compares each pair of them (older -> newer)."""
+        scored = {}
+        for time_range in self.time_ranges:
+            music_data = self.score(time_range)
+            if music_data is not None:
+                scored[time_range] = music_data
+        # Ranges are listed newest first, so in each pair the second one is the older range
+        drift = [self.drift(older, newer, scored) for newer, older in combinations(scored, 2)]
+        return ExtendedMusicData(ranges=scored, drift=drift)
+
+
+# Weights of the pairwise compatibility score; genres say the most about a shared aux cord
+COMPATIBILITY_WEIGHTS = {"genres": 0.5, "artists": 0.3, "tracks": 0.2}
+
+
+def compare_group(scorer: IncrementalScorer, scored: Dict[str, MusicData]) -> GroupComparison:
+    """
+    Compares group members folded into `scorer` (one key per member) and scored into
+    `scored`, which needs at least two members. Pairwise overlaps come from the scorer's
+    running counts; shared artists and genres are those at least two members have.
+    """
+    names = list(scored)
+    matches = []
+    for a, b in combinations(names, 2):
+        artist_overlap, track_overlap, genre_similarity = scorer.similarity(a, b)
+        compatibility = (
+            COMPATIBILITY_WEIGHTS["genres"] * genre_similarity
+            + COMPATIBILITY_WEIGHTS["artists"] * artist_overlap
+            + COMPATIBILITY_WEIGHTS["tracks"] * track_overlap
+        )
+        matches.append(MemberMatch(
+            members=[a, b],
+            artist_overlap=artist_overlap,
+            track_overlap=track_overlap,
+            genre_similarity=genre_similarity,
+            compatibility=round(compatibility * 100),
+        ))
+    matches.sort(key=lambda m: -m.compatibility)
+
+    def shared(values_by_member: List[List[str]]) -> List[str]:
+        # Counter keeps first-seen order among ties
+        counts = Counter(v for values in values_by_member for v in dict.fromkeys(values))
+        return [v for v, n in counts.most_common() if n >= 2]
+
+    return GroupComparison(
+        average_taste_score=round(sum(m.taste_score for m in scored.values()) / len(scored), 1),
+        most_basic=min(names, key=lambda n: scored[n].taste_score),
+        most_obscure=max(names, key=lambda n: scored[n].taste_score),
+        shared_artists=shared([[a.name for a in m.top_artists] for m in scored.values()])[:10],
+        shared_genres=shared([m.dominating_genres for m in scored.values()]),
+        matches=matches,
+    )
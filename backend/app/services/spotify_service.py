@@ -1,52 +1,460 @@
+import asyncio
+import importlib.util
+import inspect
+import logging
+import math
+import random
+import time
+from email.utils import parsedate_to_datetime
 import httpx
-from typing import List, Dict, Any
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Dict, Any, Sequence
 from app.schemas.music import Track, Artist, MusicData
+from app.core.deadline import DeadlineExceeded, time_left
+from app.core.metrics import counter, gauge, register_cache
+from app.core.resilience import CircuitBreaker, TokenBucket
+from app.core.tiered_cache import TieredCache
+from app.core.tracing import span
+from app.services.scoring_service import TIME_RANGES
+from app.services.spotify_snapshots import SPOTIFY_SNAPSHOTS, CachedResponse, UserSnapshot, snapshot_store
 import os
 
+if TYPE_CHECKING:
+    from app.services.scoring_service import IncrementalScorer
+
+logger = logging.getLogger(__name__)
+
+OPTIONAL_CALL_FAILURES = counter(
+    "roastmytune_spotify_optional_failures_total", "Optional Spotify calls that failed without failing the request", ["call"]
+)
+RATE_LIMIT_EVENTS = counter(
+    "roastmytune_spotify_rate_limit_events_total",
+    "Spotify call events: throttled (429), retried, shed (never sent: breaker open or no token in time), gave_up (retries exhausted)",
+    ["call", "event"],
+)
+
+
+class SpotifyUnavailable(Exception):
+    """Spotify is rate limiting us or failing; the API answers 503 with `retry_after` as a hint."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+@dataclass
+class SpotifyProfile:
+    """Result of the concurrent profile fetch. Optional calls that failed are listed in `errors`."""
+    top_artists: List[Artist]
+    top_tracks: List[Track]
+    recent_tracks: List[Track] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+    fetch_ms: float = 0.0
+    # The user's snapshot and the ETags of the top artists/tracks responses, for score reuse
+    snapshot: UserSnapshot | None = None
+    etags: tuple | None = None
+
+
+# Process-wide pooled client: keep-alive connections to api.spotify.com are reused
+# across requests instead of paying a TCP+TLS handshake on every roast.
+_http_client: httpx.AsyncClient | None = None
+SPOTIFY_TIMEOUT = float(os.getenv("SPOTIFY_TIMEOUT", "5"))
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("SPOTIFY_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("SPOTIFY_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("SPOTIFY_KEEPALIVE_EXPIRY", "30")),
+    )
+    http2 = _env_flag("SPOTIFY_HTTP2")
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("SPOTIFY_HTTP2 is set but the 'h2' package is missing (pip install httpx[http2]); using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        limits=limits,
+        http2=http2,
+        timeout=httpx.Timeout(SPOTIFY_TIMEOUT),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+async def warm_http_client(connections: int = 4):
+    """
+    Opens `connections` keep-alive connections to the Web API so the first roasts skip the
+    TCP+TLS handshake. The unauthenticated requests are answered with 401, which is fine.
+    """
+    client = get_http_client()
+    base_url = os.getenv("SPOTIFY_API_BASE_URL", "https://api.spotify.com/v1")
+    results = await asyncio.gather(*(client.get(f"{base_url}/me") for _ in range(connections)), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Audio features are global facts, so they are shared across users (and across workers,
+# through the shared cache tier). Only ids that miss here are requested from Spotify. Tracks Spotify has no features for are cached as None for a shorter time
+# (negative caching).
+SPOTIFY_METADATA_CACHE_TTL = float(os.getenv("SPOTIFY_METADATA_CACHE_TTL", "86400"))
+SPOTIFY_NEGATIVE_CACHE_TTL = float(os.getenv("SPOTIFY_NEGATIVE_CACHE_TTL", "3600"))
+_metadata_cache_bytes = int(float(os.getenv("SPOTIFY_METADATA_CACHE_MAX_MB", "64")) * 1024 * 1024)
+_metadata_shared_bytes = int(float(os.getenv("SPOTIFY_METADATA_SHARED_CACHE_MAX_MB", "512")) * 1024 * 1024)
+_audio_features_cache = TieredCache(
+    "spotify_audio_features", ttl=SPOTIFY_METADATA_CACHE_TTL, max_entries=500_000,
+    max_bytes=_metadata_cache_bytes, back_max_bytes=_metadata_shared_bytes,
+)
+# Set when Spotify refuses /audio-features for this app (403), so we stop asking for a while
+_audio_features_blocked_until = 0.0
+register_cache("spotify_audio_features", _audio_features_cache)
+
+
+# Spotify rate limits per app, not per user, so one bucket and one breaker cover the process.
+# Every worker has its own bucket, so a fixed SPOTIFY_RATE_LIMIT_RPS can't enforce the app-wide
+# limit and only adds queueing; by default (0) calls are unmetered until Spotify answers 429.
+# Then Retry-After pauses the bucket and it meters from half of SPOTIFY_THROTTLED_RPS, halving
+# again on each further 429 and lifting once successes have climbed it back to that rate.
+_rate_limiter = TokenBucket(
+    rate=float(os.getenv("SPOTIFY_RATE_LIMIT_RPS", "0")),
+    burst=float(os.getenv("SPOTIFY_RATE_LIMIT_BURST", "100")),
+    throttled_rate=float(os.getenv("SPOTIFY_THROTTLED_RPS", "200")),
+)
+_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("SPOTIFY_BREAKER_FAILURES", "10")),
+    reset_timeout=float(os.getenv("SPOTIFY_BREAKER_RESET_SECONDS", "15")),
+)
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "2"))
+# Longest a call may queue for a token or sleep before a retry when the request has no deadline
+SPOTIFY_MAX_WAIT = float(os.getenv("SPOTIFY_MAX_WAIT_SECONDS", "3"))
+RETRY_BASE_DELAY = 0.2
+RETRY_JITTER = 0.25
+
+gauge(
+    "roastmytune_spotify_limiter",
+    "Spotify client limiter state: current rate (req/s, 0 = unmetered), circuit open (1) or not, seconds paused by Retry-After",
+    ["stat"],
+    fn=lambda: {
+        ("rate",): _rate_limiter.rate,
+        ("circuit_open",): int(_breaker.state == "open"),
+        ("paused_seconds",): max(0.0, _rate_limiter.paused_until - time.monotonic()),
+    },
+)
+
+
+def _retry_after_seconds(response: httpx.Response) -> float | None:
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Top items come in pages of at most 50, and Spotify serves at most 99 per time range
+# (the second page starts at offset 49).
+SPOTIFY_PAGE_SIZE = 50
+SPOTIFY_TOP_ITEMS_MAX = int(os.getenv("SPOTIFY_TOP_ITEMS_MAX", "99"))
+
+
+def top_item_pages(max_items: int) -> List[tuple]:
+    """(offset, limit) pairs covering the first `max_items` items; the last page may overlap the previous one."""
+    if max_items <= SPOTIFY_PAGE_SIZE:
+        return [(0, max_items)]
+    return [(min(offset, max_items - SPOTIFY_PAGE_SIZE), SPOTIFY_PAGE_SIZE) for offset in range(0, max_items, SPOTIFY_PAGE_SIZE)]
+
+
+async def _cache_with_negatives(cache: TieredCache, fetched: Dict[str, Any]):
+    """Caches fetched values; ids Spotify returned nothing for are kept for SPOTIFY_NEGATIVE_CACHE_TTL only."""
+    await cache.set_many({k: v for k, v in fetched.items() if v})
+    await cache.set_many({k: v for k, v in fetched.items() if not v}, ttl=SPOTIFY_NEGATIVE_CACHE_TTL)
+
+
 class SpotifyService:
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, client: httpx.AsyncClient | None = None):
         self.access_token = access_token
-        self.base_url = "https://api.spotify.com/v1"
-        self.client = httpx.AsyncClient(headers={
-            "Authorization": f"Bearer {access_token}"
-        })
+        self.base_url = os.getenv("SPOTIFY_API_BASE_URL", "https://api.spotify.com/v1")
+        # The client is shared, so the per-user bearer token goes on each call
+        self.client = client or get_http_client()
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        # Loaded by fetch_profile / fetch_extended_profile (see _with_snapshot)
+        self._snapshot: UserSnapshot | None = None
+        self._etags: Dict[tuple, str] = {}
+
+    async def _get(self, call: str, path: str, params: Dict[str, Any], headers: Dict[str, str] | None = None) -> httpx.Response:
+        """
+        One authenticated GET against the Web API, timed as stage `spotify.<call>`.
+
+        Calls go through the app-wide token bucket and circuit breaker. 429s pause the bucket
+        for Retry-After and are retried (as are 5xx and network errors) with jittered backoff,
+        as long as the wait fits in the request deadline (or SPOTIFY_MAX_WAIT_SECONDS).
+        When Spotify can't be reached in time this raises SpotifyUnavailable instead of
+        piling more load onto it. Under a deadline, each attempt's timeout shrinks to the time left.
+        """
+        for attempt in range(SPOTIFY_MAX_RETRIES + 1):
+            remaining = time_left()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded(f"Deadline passed before Spotify {call}")
+            max_wait = SPOTIFY_MAX_WAIT if remaining is None else min(SPOTIFY_MAX_WAIT, remaining)
+
+            if not _breaker.allow():
+                RATE_LIMIT_EVENTS.inc(call=call, event="shed")
+                raise SpotifyUnavailable("Spotify circuit breaker is open", _breaker.retry_after())
+            if not await _rate_limiter.acquire(max_wait=max_wait):
+                RATE_LIMIT_EVENTS.inc(call=call, event="shed")
+                raise SpotifyUnavailable("Spotify rate limit budget exhausted", _rate_limiter.delay())
+
+            timeout = httpx.USE_CLIENT_DEFAULT
+            remaining = time_left()
+            if remaining is not None:
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"Deadline passed before Spotify {call}")
+                timeout = min(SPOTIFY_TIMEOUT, remaining)
+
+            retry_after = None
+            try:
+                with span(f"spotify.{call}"):
+                    response = await self.client.get(
+                        f"{self.base_url}{path}", params=params, headers={**self.headers, **headers} if headers else self.headers, timeout=timeout
+                    )
+            except httpx.TransportError as e:
+                _breaker.record_failure()
+                failure = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 429:
+                    RATE_LIMIT_EVENTS.inc(call=call, event="throttled")
+                    retry_after = _retry_after_seconds(response)
+                    _rate_limiter.pause(retry_after if retry_after is not None else RETRY_BASE_DELAY)
+                    _rate_limiter.slow_down()
+                    failure = "429 Too Many Requests"
+                elif response.status_code >= 500:
+                    _breaker.record_failure()
+                    failure = f"{response.status_code} from Spotify"
+                else:
+                    _breaker.record_success()
+                    _rate_limiter.recover()
+                    return response
 
-    async def close(self):
-        await self.client.aclose()
+            delay = (retry_after or 0.0) + random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt + RETRY_JITTER)
+            remaining = time_left()
+            budget = SPOTIFY_MAX_WAIT if remaining is None else min(SPOTIFY_MAX_WAIT, remaining)
+            if attempt == SPOTIFY_MAX_RETRIES or delay >= budget:
+                RATE_LIMIT_EVENTS.inc(call=call, event="gave_up")
+                raise SpotifyUnavailable(f"Spotify {call} failed: {failure}", retry_after or delay)
+            RATE_LIMIT_EVENTS.inc(call=call, event="retried")
+            logger.info("Retrying Spotify call", extra={"call": call, "attempt": attempt + 1, "delay_s": round(delay, 3), "reason": failure})
+            await asyncio.sleep(delay)
 
-    async def get_top_artists(self, limit: int = 20, time_range: str = "medium_term") -> List[Artist]:
-        response = await self.client.get(
-            f"{self.base_url}/me/top/artists",
-            params={"limit": limit, "time_range": time_range}
+    async def get_spotify_user_id(self) -> str:
+        """The token owner's Spotify user id (remembered per token, so /me is asked once)."""
+        user_id = snapshot_store.user_for_token(self.access_token)
+        if user_id is None:
+            response = await self._get("me", "/me", {})
+            response.raise_for_status()
+            user_id = response.json()["id"]
+            snapshot_store.remember_token(self.access_token, user_id)
+        return user_id
+
+    async def _with_snapshot(self, fetch):
+        """
+        Runs `fetch()` with the user's snapshot loaded, so top-item requests are conditional,
+        then stores the snapshot with whatever changed. The first time a token is seen the
+        user id isn't known yet: /me is then asked alongside the fetch (nothing to revalidate
+        this time, but the ETags are kept for the next request). /me failing only skips that.
+        """
+        if not SPOTIFY_SNAPSHOTS:
+            return await fetch()
+        user_id = snapshot_store.user_for_token(self.access_token)
+        if user_id is not None:
+            self._snapshot = snapshot_store.get(user_id) or UserSnapshot()
+            result = await fetch()
+            snapshot_store.put(user_id, self._snapshot)
+            return result
+
+        self._snapshot = UserSnapshot()
+        lookup = asyncio.ensure_future(self.get_spotify_user_id())
+        try:
+            result = await fetch()
+        except BaseException:
+            lookup.cancel()
+            raise
+        try:
+            user_id = await lookup
+        except Exception as e:
+            logger.warning("Optional Spotify call failed", extra={"call": "me", "error": str(e)})
+            OPTIONAL_CALL_FAILURES.inc(call="me")
+            return result
+        existing = snapshot_store.get(user_id)
+        if existing is not None:
+            existing.responses.update(self._snapshot.responses)
+            self._snapshot = existing
+        snapshot_store.put(user_id, self._snapshot)
+        return result
+
+    async def fetch_profile(self, limit: int = 20, include_recent: bool = True) -> SpotifyProfile:
+        """
+        Fetches top artists, top tracks (+ their audio features) and recent tracks as one
+        concurrent fan-out, so the stage costs the slowest call instead of the sum of all.
+        Top artists/tracks are required and re-raise on failure; recent tracks are optional
+        and fall back to an empty list. Top items are revalidated against the user's snapshot;
+        pass the result to spotify_snapshots.score_profile to reuse the score as well.
+        """
+        profile = await self._with_snapshot(lambda: self._fetch_profile(limit, include_recent))
+        artists_etag = self._etags.get(("top_artists", "medium_term", limit, 0))
+        tracks_etag = self._etags.get(("top_tracks", "medium_term", limit, 0))
+        profile.snapshot = self._snapshot
+        profile.etags = (artists_etag, tracks_etag) if artists_etag and tracks_etag else None
+        return profile
+
+    async def _fetch_profile(self, limit: int, include_recent: bool) -> SpotifyProfile:
+        calls = {
+            "top_artists": self.get_top_artists(limit=limit),
+            "top_tracks": self.get_top_tracks(limit=limit),
+        }
+        if include_recent:
+            calls["recent_tracks"] = self.get_recent_tracks(limit=limit)
+
+        start = time.perf_counter()
+        with span("spotify"):
+            results = dict(zip(calls, await asyncio.gather(*calls.values(), return_exceptions=True)))
+        fetch_ms = (time.perf_counter() - start) * 1000
+
+        errors = {}
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                if name in ("top_artists", "top_tracks"):
+                    raise result
+                logger.warning("Optional Spotify call failed", extra={"call": name, "error": str(result)})
+                OPTIONAL_CALL_FAILURES.inc(call=name)
+                errors[name] = str(result)
+                results[name] = []
+
+        logger.info("Spotify fetch stage done", extra={"fetch_ms": round(fetch_ms, 1), "calls": len(calls), "failed": len(errors)})
+
+        return SpotifyProfile(
+            top_artists=results["top_artists"],
+            top_tracks=results["top_tracks"],
+            recent_tracks=results.get("recent_tracks", []),
+            errors=errors,
+            fetch_ms=fetch_ms,
         )
-        response.raise_for_status()
-        data = response.json()
-        
-        return [
-            Artist(
-                id=item["id"],
-                name=item["name"],
-                genres=item["genres"],
-                popularity=item["popularity"],
-                image_url=item["images"][0]["url"] if item["images"] else None
-            ) for item in data["items"]
+
+    async def fetch_extended_profile(
+        self,
+        scorer: "IncrementalScorer",
+        time_ranges: Sequence[str] = TIME_RANGES,
+        max_items: int = SPOTIFY_TOP_ITEMS_MAX,
+    ):
+        """
+        Fetches top artists and tracks for every time range, up to `max_items` each, as one
+        concurrent batch of page requests (conditional, like fetch_profile). Each page is folded
+        into `scorer` as soon as it (and, for tracks, its audio features) arrives, so scoring
+        overlaps the network. Raises the first failure once all pages have settled.
+        """
+        await self._with_snapshot(lambda: self._fetch_extended_profile(scorer, time_ranges, max_items))
+
+    async def _fetch_extended_profile(self, scorer: "IncrementalScorer", time_ranges: Sequence[str], max_items: int):
+        async def artist_page(time_range: str, offset: int, limit: int):
+            scorer.add_artists(time_range, offset, await self.get_top_artists(limit, time_range, offset))
+
+        async def track_page(time_range: str, offset: int, limit: int):
+            scorer.add_tracks(time_range, offset, await self.get_top_tracks(limit, time_range, offset))
+
+        pages = [
+            page(time_range, offset, limit)
+            for time_range in time_ranges
+            for offset, limit in top_item_pages(max_items)
+            for page in (artist_page, track_page)
         ]
+        start = time.perf_counter()
+        with span("spotify"):
+            results = await asyncio.gather(*pages, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        logger.info("Extended Spotify fetch done", extra={
+            "fetch_ms": round((time.perf_counter() - start) * 1000, 1), "pages": len(pages),
+        })
 
-    async def get_top_tracks(self, limit: int = 20, time_range: str = "medium_term") -> List[Track]:
-        response = await self.client.get(
-            f"{self.base_url}/me/top/tracks",
-            params={"limit": limit, "time_range": time_range}
+    async def _top_items(self, call: str, path: str, time_range: str, limit: int, offset: int, parse):
+        """
+        One page of top items, parsed by `parse(items)` (plain or async). With a snapshot
+        loaded the request carries If-None-Match, and a 304 returns the objects parsed last time.
+        """
+        key = (call, time_range, limit, offset)
+        cached = self._snapshot.responses.get(key) if self._snapshot is not None else None
+        response = await self._get(
+            call, path, {"limit": limit, "offset": offset, "time_range": time_range},
+            headers={"If-None-Match": cached.etag} if cached is not None else None,
         )
+        if response.status_code == 304 and cached is not None:
+            snapshot_store.record(call, "not_modified")
+            self._etags[key] = cached.etag
+            return cached.value
         response.raise_for_status()
-        data = response.json()
-        
+        value = parse(response.json()["items"])
+        if inspect.isawaitable(value):
+            value = await value
+        if self._snapshot is not None:
+            snapshot_store.record(call, "modified" if cached is not None else "uncached")
+            etag = response.headers.get("etag")
+            if etag:
+                self._snapshot.responses[key] = CachedResponse(etag, value, len(response.content))
+                self._etags[key] = etag
+        return value
+
+    async def get_top_artists(self, limit: int = 20, time_range: str = "medium_term", offset: int = 0) -> List[Artist]:
+        return await self._top_items("top_artists", "/me/top/artists", time_range, limit, offset, self._parse_artists)
+
+    @classmethod
+    def _parse_artists(cls, items: List[Dict[str, Any]]) -> List[Artist]:
+        return [cls._parse_artist(item) for item in items]
+
+    @staticmethod
+    def _parse_artist(item: Dict[str, Any]) -> Artist:
+        return Artist(
+            id=item["id"],
+            name=item["name"],
+            genres=item["genres"],
+            popularity=item["popularity"],
+            image_url=item["images"][0]["url"] if item["images"] else None
+        )
+
+    async def get_top_tracks(self, limit: int = 20, time_range: str = "medium_term", offset: int = 0) -> List[Track]:
+        return await self._top_items("top_tracks", "/me/top/tracks", time_range, limit, offset, self._tracks_with_features)
+
+    async def _tracks_with_features(self, tracks_data: List[Dict[str, Any]]) -> List[Track]:
         # We need to fetch audio features separately
         try:
-            tracks_data = data["items"]
             track_ids = [t["id"] for t in tracks_data]
             audio_features = await self.get_audio_features(track_ids)
         except Exception as e:
-            print(f"Warning: Failed to fetch audio features: {e}")
+            logger.warning("Failed to fetch audio features", extra={"error": str(e)})
+            OPTIONAL_CALL_FAILURES.inc(call="audio_features")
             audio_features = [] # Fallback to empty features
         
         tracks = []
@@ -71,10 +479,7 @@ class SpotifyService:
         return tracks
 
     async def get_recent_tracks(self, limit: int = 20) -> List[Track]:
-        response = await self.client.get(
-            f"{self.base_url}/me/player/recently-played",
-            params={"limit": limit}
-        )
+        response = await self._get("recently_played", "/me/player/recently-played", {"limit": limit})
         response.raise_for_status()
         data = response.json()
         
@@ -93,21 +498,30 @@ class SpotifyService:
             ) for item in tracks_data
         ]
 
-    async def get_audio_features(self, track_ids: List[str]) -> List[Dict[str, Any]]:
+    async def get_audio_features(self, track_ids: List[str]) -> List[Dict[str, Any] | None]:
+        """
+        Audio features aligned with `track_ids` (None where Spotify has none).
+        Cached ids are served locally; the rest go out in concurrent 100-id chunks.
+        """
         if not track_ids:
             return []
-        # Max 100 ids per call
-        chunks = [track_ids[i:i + 100] for i in range(0, len(track_ids), 100)]
-        all_features = []
-        
-        for chunk in chunks:
-            ids_str = ",".join(chunk)
-            response = await self.client.get(
-                f"{self.base_url}/audio-features",
-                params={"ids": ids_str}
-            )
+
+        found = await _audio_features_cache.get_many(dict.fromkeys(track_ids))
+        missing = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in found]
+
+        if missing and time.monotonic() < _audio_features_blocked_until:
+            missing = []
+
+        async def fetch_chunk(chunk: List[str]):
+            global _audio_features_blocked_until
+            response = await self._get("audio_features", "/audio-features", {"ids": ",".join(chunk)})
+            if response.status_code == 403:
+                _audio_features_blocked_until = time.monotonic() + SPOTIFY_NEGATIVE_CACHE_TTL
             response.raise_for_status()
-            data = response.json()
-            all_features.extend(data["audio_features"])
-            
-        return all_features
+            fetched = dict(zip(chunk, response.json()["audio_features"]))
+            found.update(fetched)
+            await _cache_with_negatives(_audio_features_cache, fetched)
+
+        # Max 100 ids per call
+        await asyncio.gather(*(fetch_chunk(missing[i:i + 100]) for i in range(0, len(missing), 100)))
+        return [found.get(track_id) for track_id in track_ids]
@@ -0,0 +1,111 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable
+from app.core.cache import TTLCache
+from app.core.metrics import counter, register_cache
+from app.core.singleflight import token_hash
+from app.schemas.music import MusicData
+
+SNAPSHOT_EVENTS = counter(
+    "roastmytune_spotify_snapshot_total",
+    "Conditional Spotify fetches by result: not_modified (304, snapshot reused), modified, uncached "
+    "(no ETag to send); and score reuse (call=score)",
+    ["call", "result"],
+)
+
+# Set SPOTIFY_SNAPSHOTS=off to always fetch and rescore
+SPOTIFY_SNAPSHOTS = os.getenv("SPOTIFY_SNAPSHOTS", "on").lower() != "off"
+SPOTIFY_SNAPSHOT_TTL = float(os.getenv("SPOTIFY_SNAPSHOT_TTL", "86400"))
+SPOTIFY_SNAPSHOT_MAX_MB = float(os.getenv("SPOTIFY_SNAPSHOT_MAX_MB", "128"))
+
+
+@dataclass
+class CachedResponse:
+    etag: str
+    value: Any  # the parsed objects (Artist / Track lists), reused as-is on a 304
+    size: int   # bytes of the response body, for eviction
+
+
+@dataclass
+class UserSnapshot:
+    """The last responses seen for one Spotify user, and the score computed from them."""
+    responses: Dict[Hashable, CachedResponse] = field(default_factory=dict)
+    score: MusicData | None = None
+    # ETags of the top artists/tracks responses `score` was computed from
+    score_etags: tuple | None = None
+
+    @property
+    def size(self) -> int:
+        return sum(r.size for r in self.responses.values())
+
+
+class SnapshotStore:
+    """
+    Per-user snapshots keyed by Spotify user id, evicted least recently used first once
+    their responses add up to `max_bytes`. Spotify tokens are mapped to user ids here too,
+    so a known token needs no extra /me call.
+
+    `hit_rate` is the share of fetches answered with 304 Not Modified from a snapshot.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = SPOTIFY_SNAPSHOT_TTL, max_users: int = 100_000):
+        self._snapshots = TTLCache(max_entries=max_users, ttl=ttl, max_bytes=max_bytes, sizeof=lambda s: s.size)
+        self._token_users = TTLCache(max_entries=max_users, ttl=3600)
+        self.not_modified = 0
+        self.fetched = 0
+        self.scores_reused = 0
+
+    def user_for_token(self, access_token: str) -> str | None:
+        return self._token_users.get(token_hash(access_token))
+
+    def remember_token(self, access_token: str, user_id: str):
+        self._token_users.set(token_hash(access_token), user_id)
+
+    def get(self, user_id: str) -> UserSnapshot | None:
+        return self._snapshots.get(user_id)
+
+    def put(self, user_id: str, snapshot: UserSnapshot):
+        """Stores (or re-sizes, after new responses were added) a user's snapshot."""
+        self._snapshots.set(user_id, snapshot)
+
+    def record(self, call: str, result: str):
+        SNAPSHOT_EVENTS.inc(call=call, result=result)
+        if result == "not_modified":
+            self.not_modified += 1
+        else:
+            self.fetched += 1
+
+    @property
+    def stats(self) -> dict:
+        cache = self._snapshots.stats
+        requests = self.not_modified + self.fetched
+        return {
+            "size": cache["size"],
+            "bytes": cache["bytes"],
+            "evictions": cache["evictions"],
+            "hits": self.not_modified,
+            "misses": self.fetched,
+            "hit_rate": self.not_modified / requests if requests else 0.0,
+            "scores_reused": self.scores_reused,
+        }
+
+
+snapshot_store = SnapshotStore(max_bytes=int(SPOTIFY_SNAPSHOT_MAX_MB * 1024 * 1024))
+register_cache("spotify_snapshots", snapshot_store)
+
+
+def score_profile(profile, scorer) -> MusicData:
+    """
+    scorer.calculate_score for a fetched SpotifyProfile, except that the previous score is
+    reused when Spotify reported the same top artists and tracks (same ETags) as last time.
+    Callers may modify the returned object; the snapshot keeps its own copy.
+    """
+    snapshot, etags = profile.snapshot, profile.etags
+    if snapshot is not None and etags is not None and snapshot.score is not None and snapshot.score_etags == etags:
+        snapshot_store.scores_reused += 1
+        SNAPSHOT_EVENTS.inc(call="score", result="reused")
+        return snapshot.score.model_copy()
+    music_data = scorer.calculate_score(profile.top_artists, profile.top_tracks)
+    if snapshot is not None and etags is not None and music_data is not None:
+        snapshot.score, snapshot.score_etags = music_data.model_copy(), etags
+    return music_data
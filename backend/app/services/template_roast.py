@@ -0,0 +1,129 @@
+import zlib
+from app.schemas.music import GroupComparison, MusicData
+
+# Everything here is plain string formatting over MusicData, so a roast costs microseconds.
+# It is what users get when the LLM is too slow for the request deadline or fails outright.
+
+OPENERS = [
+    "{artist} at the top of your list? Bold of you to admit that in public.",
+    "Your number one is {artist}. We checked twice, hoping it was a glitch.",
+    "So {artist} is your personality now. Cool, cool.",
+    "Leading with {artist} tells us everything and none of it is good.",
+]
+
+SCORE_LINES = [
+    (80, "A {score}/100 taste score means you've heard of things. You will not stop mentioning it."),
+    (60, "At {score}/100 you're one vinyl purchase away from being insufferable."),
+    (40, "{score}/100: aggressively average, like a playlist called 'Vibes'."),
+    (20, "{score}/100. Your taste is whatever the algorithm decided for you this morning."),
+    (0, "{score}/100. The Billboard Hot 100 called, it wants its only listener back."),
+]
+
+GENRE_LINES = [
+    "All that {genre} and somehow still no personality.",
+    "You treat {genre} like a lifestyle and it shows.",
+    "Nobody needed this much {genre} in one account.",
+]
+
+# Persona nouns by trait, first match in the user's trait order wins
+PERSONAS = {
+    "Basic": "Top 40 Loyalist",
+    "NPC": "Aux Cord NPC",
+    "Billboard Bot": "Chart Refresh Enjoyer",
+    "Mainstream-Adjacent": "Spotify Wrapped Tourist",
+    "Playlist Andy": "Playlist Andy",
+    "Average": "Perfectly Mid Listener",
+    "Mid": "Perfectly Mid Listener",
+    "Indie Kid": "Tote Bag Indie Kid",
+    "Pretentious": "Liner Notes Lecturer",
+    "Hipster": "Before-They-Were-Famous Hipster",
+    "Obscure AF": "Bandcamp Archaeologist",
+    "Contrarian": "Professional Contrarian",
+    "Stan Account": "Lightstick-Wielding Stan",
+    "Edge Lord": "Black Hoodie Edge Lord",
+    "Yeehaw": "Suburban Cowboy",
+    "Bars Only": "Gas Station Rap Critic",
+    "Smooth Operator": "Late Night R&B Texter",
+    "Guitar Hero": "Dad Rock Apprentice",
+}
+
+ERAS = {
+    "80s Nostalgia": ("1986 Synth Era", "Mentally wearing shoulder pads at a mall that closed decades ago."),
+    "90s Kid": ("1997 Flannel Era", "Still waiting for your dial-up to connect to the group chat."),
+    "Boomer Energy": ("1973 Classic Rock Era", "You say 'they don't make music like this anymore' unprompted."),
+    "Modern": ("2019 Algorithm Era", "Your taste was assembled by a recommendation engine during lockdown."),
+}
+
+HOUSES = [
+    ({"Edge Lord", "Guitar Hero", "Yeehaw"}, "Gryffindor", "Loud, reckless and convinced that volume is a personality."),
+    ({"Bars Only", "Smooth Operator", "Stan Account"}, "Slytherin", "Ambitious enough to defend every questionable feature verse."),
+    ({"Hipster", "Obscure AF", "Contrarian", "Indie Kid", "Pretentious"}, "Ravenclaw", "Knows every obscure B-side and makes sure you know it too."),
+]
+DEFAULT_HOUSE = ("Hufflepuff", "Loyal to the same five songs since the day you made an account.")
+
+
+GROUP_TITLES = [
+    "The Aux Cord Hostage Situation",
+    "Group Chat of Questionable Taste",
+    "The Shared Playlist Nobody Likes",
+    "Mutual Musical Disappointment Society",
+]
+
+
+def _pick(options: list, seed: int, salt: int) -> str:
+    return options[(seed + salt) % len(options)]
+
+
+def template_roast(music_data: MusicData | None) -> dict:
+    """
+    Builds a complete roast (roast, persona, era, hogwarts_house) from MusicData without an LLM.
+    The same profile always gets the same wording.
+    """
+    if music_data is None:
+        return {
+            "roast": "Your listening history is so empty even we couldn't find anything to roast.",
+            "persona": "Silent Listener",
+            "era": {"title": ERAS["Modern"][0], "description": ERAS["Modern"][1]},
+            "hogwarts_house": {"house": DEFAULT_HOUSE[0], "reason": DEFAULT_HOUSE[1]},
+        }
+
+    artist = music_data.top_artists[0].name if music_data.top_artists else "nobody in particular"
+    seed = zlib.crc32(f"{artist}|{music_data.taste_score}|{','.join(music_data.dominating_genres)}".encode())
+
+    sentences = [_pick(OPENERS, seed, 0).format(artist=artist)]
+    if music_data.dominating_genres:
+        sentences.append(_pick(GENRE_LINES, seed, 1).format(genre=music_data.dominating_genres[0]))
+    score = music_data.taste_score
+    sentences.append(next(line for floor, line in SCORE_LINES if score >= floor).format(score=score))
+
+    persona = next((PERSONAS[t] for t in music_data.roast_traits if t in PERSONAS), "Basic Music Consumer")
+    era_title, era_description = ERAS.get(music_data.musical_era, ERAS["Modern"])
+    traits = set(music_data.roast_traits)
+    house, reason = next(((h, r) for group, h, r in HOUSES if group & traits), DEFAULT_HOUSE)
+
+    return {
+        "roast": " ".join(sentences),
+        "persona": persona,
+        "era": {"title": era_title, "description": era_description},
+        "hogwarts_house": {"house": house, "reason": reason},
+    }
+
+
+def template_group_roast(comparison: GroupComparison) -> dict:
+    """The group roast (title, roast) from a GroupComparison without an LLM, worded like template_roast."""
+    seed = zlib.crc32("|".join(sorted({n for m in comparison.matches for n in m.members})).encode())
+    sentences = [
+        f"{comparison.most_basic} dragged the group average down to {comparison.average_taste_score:g}/100, "
+        f"and {comparison.most_obscure} will not stop bringing it up."
+    ]
+    if comparison.shared_genres:
+        sentences.append(f"The only thing you all agree on is {comparison.shared_genres[0]}, which says a lot.")
+    else:
+        sentences.append("You share zero genres, which explains every fight over the aux cord.")
+    if len(comparison.matches) > 1:
+        best, worst = comparison.matches[0], comparison.matches[-1]
+        sentences.append(
+            f"{' and '.join(best.members)} are {best.compatibility}% compatible; "
+            f"{' and '.join(worst.members)} should never share a car."
+        )
+    return {"title": _pick(GROUP_TITLES, seed, 0), "roast": " ".join(sentences)}
@@ -0,0 +1,102 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from app.core.metrics import gauge
+
+logger = logging.getLogger(__name__)
+
+# Off by default: the SDKs and pools are then built by the first request that needs them
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "false").strip().lower() in ("1", "true", "yes", "on")
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "15"))
+
+# Seconds spent in each startup phase, exported as a gauge
+startup_phases: dict[str, float] = {}
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Records how long the block took under `startup_phases[name]`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases[name] = round(time.perf_counter() - started, 4)
+
+
+async def _import_sdk(module: str):
+    """
+    Importing an SDK is blocking CPU work, so it runs in a thread. The clients themselves are
+    built on the event loop afterwards: requests build the same lazy singletons there, and
+    their check-then-set is only safe while everything runs on the loop.
+    """
+    await asyncio.to_thread(importlib.import_module, module)
+
+
+async def _gemini():
+    from app.services.gemini_service import get_gemini_service
+
+    await _import_sdk("google.generativeai")
+    get_gemini_service()
+
+
+async def _auth():
+    from app.services import auth_service
+
+    if auth_service.SUPABASE_AUTH_MODE == "local":
+        if auth_service.SUPABASE_JWKS_URL and not auth_service.SUPABASE_JWT_SECRET:
+            await auth_service.get_local_verifier().refresh()
+    else:
+        await _import_sdk("supabase")
+        auth_service.get_supabase_client()
+
+
+async def _spotify():
+    from app.services.spotify_service import warm_http_client
+
+    await warm_http_client(WARMUP_CONNECTIONS)
+
+
+async def _database():
+    if not os.getenv("DATABASE_URL"):
+        return
+    from app.core.database import warm_engine
+
+    await warm_engine(WARMUP_CONNECTIONS)
+
+
+WARMUP_STEPS = {"gemini": _gemini, "auth": _auth, "spotify": _spotify, "database": _database}
+
+
+async def warm_up(timeout: float = WARMUP_TIMEOUT) -> dict[str, str]:
+    """
+    Imports the SDKs, builds the service clients and pre-opens connection pools, all
+    concurrently. A failing or slow step is logged and skipped; the service still starts
+    and that work simply happens on the first request instead. Returns each step's outcome.
+    """
+
+    async def run(name, step):
+        with timed_phase(f"warmup.{name}"):
+            try:
+                await asyncio.wait_for(step(), timeout)
+                return "ok"
+            except Exception as e:
+                logger.warning("Warm-up step failed", extra={"step": name, "error": repr(e)})
+                return "failed"
+
+    with timed_phase("warmup"):
+        outcomes = await asyncio.gather(*(run(name, step) for name, step in WARMUP_STEPS.items()))
+    results = dict(zip(WARMUP_STEPS, outcomes))
+    logger.info("Warm-up finished", extra={"steps": results, "seconds": startup_phases["warmup"]})
+    return results
+
+
+gauge(
+    "roastmytune_startup_seconds",
+    "Seconds spent in each startup phase of this process",
+    ["phase"],
+    fn=lambda: {(name,): seconds for name, seconds in startup_phases.items()},
+)
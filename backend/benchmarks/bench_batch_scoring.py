@@ -0,0 +1,85 @@
+"""
+Throughput of batch scoring vs the per-user ScoringService path.
+
+    cd backend && python -m benchmarks.bench_batch_scoring --profiles 20000
+
+Profiles are synthetic (20 artists / 20 tracks each, genres drawn from a fixed pool).
+A sample of rows is checked against calculate_score before timing is reported.
+"""
+import argparse
+import json
+import random
+import time
+from app.schemas.music import Artist, Track
+from app.services.batch_scoring import BatchScoringService, ProfileBatch
+from app.services.scoring_service import ScoringService
+
+GENRE_POOL = [
+    "pop", "dance pop", "k-pop", "indie rock", "alternative metal", "country", "southern hip hop",
+    "rap", "r&b", "classic rock", "80s synthpop", "90s alternative", "jazz", "modern classical",
+    "folk punk", "edm", "bedroom pop", "lo-fi beats", "ambient", "trap", "grunge", "uk garage",
+] + [f"micro genre {i}" for i in range(200)]
+
+
+def make_profiles(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    profiles = []
+    for p in range(count):
+        artists = [
+            Artist(id=f"a{p}-{i}", name=f"Artist {i}", genres=rng.sample(GENRE_POOL, rng.randint(0, 6)),
+                   popularity=rng.randint(0, 100))
+            for i in range(20)
+        ]
+        tracks = [
+            Track(id=f"t{p}-{i}", name=f"Track {i}", artist_names=["x"], album_name="y",
+                  popularity=rng.randint(0, 100), danceability=rng.random(), energy=rng.random(),
+                  valence=rng.random(), tempo=rng.uniform(60, 180))
+            for i in range(20)
+        ]
+        profiles.append((artists, tracks))
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check", type=int, default=500, help="rows to compare against the per-user path")
+    args = parser.parse_args()
+
+    profiles = make_profiles(args.profiles, args.seed)
+    scorer = ScoringService()
+    batch_scorer = BatchScoringService()
+
+    start = time.perf_counter()
+    batch = ProfileBatch.from_profiles(profiles)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = batch_scorer.score(batch)
+    batch_s = time.perf_counter() - start
+
+    per_user_sample = profiles[:args.check]
+    start = time.perf_counter()
+    expected = [scorer.calculate_score(a, t) for a, t in per_user_sample]
+    per_user_s = time.perf_counter() - start
+
+    for i, music_data in enumerate(expected):
+        row = scores.row(i)
+        got = (row["taste_score"], row["roast_traits"], row["dominating_genres"], row["musical_era"])
+        want = (music_data.taste_score, music_data.roast_traits, music_data.dominating_genres, music_data.musical_era)
+        if got != want:
+            raise SystemExit(f"Mismatch on profile {i}: batch={got} per-user={want}")
+
+    print(json.dumps({
+        "profiles": args.profiles,
+        "columnar_build_s": round(build_s, 4),
+        "batch_score_s": round(batch_s, 4),
+        "batch_profiles_per_s": round(args.profiles / batch_s),
+        "per_user_profiles_per_s": round(len(per_user_sample) / per_user_s) if per_user_s else None,
+        "checked_rows": len(expected),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
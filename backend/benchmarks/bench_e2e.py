@@ -0,0 +1,283 @@
+"""
+End-to-end latency benchmark for the API, with no live services involved.
+
+Spotify and Supabase auth are replaced by local HTTP fakes (real sockets, so the pooled
+Spotify client is exercised), Gemini by an in-process fake model. The real FastAPI app,
+lifespan included, is driven in-process at a fixed concurrency.
+
+    cd backend
+    python -m benchmarks.bench_e2e --endpoint roast --concurrency 50 --requests 1000 --output bench.json
+    python -m benchmarks.bench_e2e --endpoint all --spotify-error-rate 0.05 --compare bench.json
+
+Results (p50/p95/p99, throughput, per-upstream latencies, single-flight outcomes) are printed
+as JSON and optionally written to --output; --compare prints the relative change against an
+earlier results file. The single-flight window, the shared cache tier and the client-side Spotify
+rate limit are set explicitly (see --help) and recorded in meta.config, so runs are comparable.
+Load generator, fakes and app share one event loop, so absolute numbers include some harness
+overhead; compare runs made with the same settings on the same machine.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from benchmarks.fakes import FakeGeminiModel, FakeSpotify, FakeSupabaseAuth, LatencyProfile, LocalServer
+
+ENDPOINTS = {
+    "analyze": "/api/music/analyze",
+    "roast": "/api/roast/generate",
+    "stream": "/api/roast/stream",
+}
+# Single-flight group behind each endpoint (the stream endpoint doesn't coalesce)
+FLIGHTS = {"analyze": "music_analyze", "roast": "roast_generate"}
+SINGLEFLIGHT_OUTCOMES = ("leader", "joined", "recent")
+
+
+def percentile(sorted_values: list, p: float) -> float | None:
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2),
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(values[-1], 2),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def drive(client, path: str, total: int, concurrency: int, body_for, headers_for, streaming: bool) -> dict:
+    """Closed-loop load: `concurrency` workers issue requests until `total` have been sent."""
+    latencies, ttfb, errors = [], [], Counter()
+    counter = itertools.count()
+
+    async def one(i: int):
+        started = time.perf_counter()
+        try:
+            if streaming:
+                async with client.stream("POST", path, json=body_for(i), headers=headers_for(i)) as response:
+                    first = None
+                    async for _ in response.aiter_raw():
+                        if first is None:
+                            first = time.perf_counter()
+                    status = response.status_code
+                if first is not None and status == 200:
+                    ttfb.append((first - started) * 1000)
+            else:
+                response = await client.post(path, json=body_for(i), headers=headers_for(i))
+                status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        if status == 200:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors[str(status)] += 1
+
+    async def worker():
+        while (i := next(counter)) < total:
+            await one(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "latency": summarize(latencies),
+    }
+    if streaming:
+        result["ttfb"] = summarize(ttfb)
+    return result
+
+
+async def run(args) -> dict:
+    spotify = FakeSpotify(
+        LatencyProfile(args.spotify_latency_ms, args.spotify_jitter_ms, args.spotify_error_rate, args.spotify_error_status),
+        args.seed, rate_limit_rps=args.spotify_rate_limit, retry_after=args.spotify_retry_after,
+    )
+    supabase = FakeSupabaseAuth(LatencyProfile(args.auth_latency_ms, args.auth_jitter_ms, args.auth_error_rate, 401), args.seed)
+    gemini_model = FakeGeminiModel(LatencyProfile(args.gemini_latency_ms, args.gemini_jitter_ms, args.gemini_error_rate), args.seed)
+
+    # Removed at interpreter exit, after the app has closed its cache connections
+    cache_dir = tempfile.TemporaryDirectory(prefix="roastmytune-bench-")
+
+    async with LocalServer(spotify.app) as spotify_server, LocalServer(supabase.app) as auth_server:
+        # The app reads its configuration at import time, so point it at the fakes first
+        jwt_secret = secrets.token_hex(32)
+        os.environ.update({
+            # The shared cache outlives the process; never let an earlier run's entries answer this one
+            "CACHE_BACKEND": args.cache_backend,
+            "CACHE_SQLITE_PATH": os.path.join(cache_dir.name, "cache.sqlite3"),
+            "SPOTIFY_API_BASE_URL": f"{spotify_server.url}/v1",
+            "SUPABASE_URL": auth_server.url,
+            "SUPABASE_KEY": "bench-anon-key",
+            "SUPABASE_AUTH_MODE": args.auth,
+            "SUPABASE_JWT_SECRET": jwt_secret,
+            "GEMINI_MAX_CONCURRENCY": str(args.gemini_concurrency),
+            "SPOTIFY_RATE_LIMIT_RPS": str(args.client_rate_limit),
+            # With a window, repeat users get the previous result back and the pipeline isn't timed
+            "SINGLEFLIGHT_WINDOW_SECONDS": str(args.singleflight_window),
+            "LOG_LEVEL": "INFO" if args.verbose else "WARNING",
+        })
+        import httpx
+        import jwt
+        from app.core.singleflight import COALESCED
+        from app.main import app
+        from app.services import gemini_service
+
+        gemini = gemini_service._gemini_service = gemini_service.GeminiService(model=gemini_model)
+
+        auth_tokens = [
+            jwt.encode({"sub": f"bench-user-{u}", "aud": "authenticated", "role": "authenticated",
+                        "exp": int(time.time()) + 3600}, jwt_secret, algorithm="HS256")
+            for u in range(args.users)
+        ]
+
+        def body_for(i: int) -> dict:
+            return {"spotify_access_token": f"bench-spotify-{i % args.users}", "bypass_cache": args.bypass_cache}
+
+        def headers_for(i: int) -> dict:
+            return {"Authorization": f"Bearer {auth_tokens[i % args.users]}"}
+
+        endpoints = list(ENDPOINTS) if args.endpoint == "all" else [args.endpoint]
+        results = {}
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                for name in endpoints:
+                    streaming = name == "stream"
+                    await drive(client, ENDPOINTS[name], args.warmup, min(args.concurrency, max(args.warmup, 1)), body_for, headers_for, streaming)
+                    spotify.stats.__init__()
+                    supabase.stats.__init__()
+                    gemini_model.stats.__init__()
+                    calls_before, wait_before = gemini.calls, gemini.queue_wait_ms_total
+                    flight = FLIGHTS.get(name)
+                    flight_before = {o: COALESCED.value(flight=flight, outcome=o) for o in SINGLEFLIGHT_OUTCOMES}
+
+                    result = await drive(client, ENDPOINTS[name], args.requests, args.concurrency, body_for, headers_for, streaming)
+
+                    llm_calls = gemini.calls - calls_before
+                    result["stages"] = {
+                        **{f"spotify.{call}": summarize(ms) for call, ms in spotify.stats.latencies_ms.items()},
+                        **{f"auth.{call}": summarize(ms) for call, ms in supabase.stats.latencies_ms.items()},
+                        **{f"llm.{call}": summarize(ms) for call, ms in gemini_model.stats.latencies_ms.items()},
+                        "llm.queue_wait": {
+                            "count": llm_calls,
+                            "mean_ms": round((gemini.queue_wait_ms_total - wait_before) / llm_calls, 2) if llm_calls else 0.0,
+                        },
+                    }
+                    result["injected_errors"] = {
+                        **{f"spotify.{k}": v for k, v in spotify.stats.errors.items()},
+                        **{f"auth.{k}": v for k, v in supabase.stats.errors.items()},
+                        **{f"llm.{k}": v for k, v in gemini_model.stats.errors.items()},
+                    }
+                    result["spotify_not_modified"] = dict(spotify.stats.not_modified)
+                    if flight:
+                        # leader = ran the pipeline, joined = shared an in-flight run, recent = answered from the window
+                        result["singleflight"] = {
+                            o: int(COALESCED.value(flight=flight, outcome=o) - flight_before[o]) for o in SINGLEFLIGHT_OUTCOMES
+                        }
+                    results[name] = result
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "config": vars(args),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict) -> str:
+    lines = [f"{'endpoint':<10} {'metric':<8} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        pairs = [("rps", base["rps"], result["rps"])]
+        pairs += [(p, base["latency"].get(f"{p}_ms"), result["latency"].get(f"{p}_ms")) for p in ("p50", "p95", "p99")]
+        for metric, old, new in pairs:
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            lines.append(f"{name:<10} {metric:<8} {old:>10.1f} {new:>10.1f} {change:>+7.1f}%")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=[*ENDPOINTS, "all"], default="roast")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200, help="distinct Spotify profiles / auth tokens")
+    parser.add_argument("--auth", choices=["local", "remote"], default="local", help="SUPABASE_AUTH_MODE for the app")
+    parser.add_argument("--bypass-cache", action="store_true", help="send bypass_cache=true on roast requests")
+    parser.add_argument("--gemini-concurrency", type=int, default=16)
+    parser.add_argument("--spotify-latency-ms", type=float, default=80)
+    parser.add_argument("--spotify-jitter-ms", type=float, default=20)
+    parser.add_argument("--spotify-error-rate", type=float, default=0.0)
+    parser.add_argument("--spotify-error-status", type=int, default=500)
+    parser.add_argument("--spotify-rate-limit", type=float, default=0, help="fake app-wide Spotify limit (req/s) answered with 429s; 0 = none")
+    parser.add_argument("--spotify-retry-after", type=int, default=1, help="Retry-After seconds on the fake's 429s")
+    parser.add_argument("--client-rate-limit", type=float, default=0, help="the app's SPOTIFY_RATE_LIMIT_RPS; 0 = unmetered until a 429")
+    parser.add_argument("--auth-latency-ms", type=float, default=60)
+    parser.add_argument("--auth-jitter-ms", type=float, default=15)
+    parser.add_argument("--auth-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=1200)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=300)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--singleflight-window", type=float, default=0,
+                        help="the app's SINGLEFLIGHT_WINDOW_SECONDS; 0 = only concurrent identical calls are coalesced")
+    parser.add_argument("--cache-backend", choices=["none", "sqlite"], default="none",
+                        help="the app's CACHE_BACKEND; sqlite uses a fresh file for this run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's info-level logs")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Cold start benchmark: how long a fresh process takes to import the app, run its startup,
+and answer its first successful roast.
+
+Every run is a new interpreter (nothing cached in sys.modules), started against the same
+local Spotify fake used by bench_e2e; auth is checked locally with a throwaway JWT secret and
+Gemini is the in-process fake model. Reported per run and as medians:
+
+    import_ms          `import app.main`
+    lifespan_ms        the FastAPI lifespan startup
+    ready_ms           until GET /ready answers 200 (includes the warm-up with --warmup)
+    first_request_ms   from the end of startup until the first roast returned 200
+    total_ms           process start until that first 200, as seen by this script
+    deferred_imports   modules that are loaded on demand and what importing them costs later
+
+    cd backend
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 5 --warmup --output startup.json
+    python -m benchmarks.bench_startup --max-import-ms 600 --max-first-request-ms 400   # CI gate
+
+With the --max-* options the exit status is 1 when a median goes over its limit.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Imported on first use rather than by `import app.main`; a regression here shows up as import time
+DEFERRED_MODULES = ("google.generativeai", "supabase", "sqlalchemy")
+
+
+async def child_main():
+    """Runs inside the fresh interpreter; prints one JSON line of timings."""
+    started = time.perf_counter()
+    from app.main import app
+    import_ms = (time.perf_counter() - started) * 1000
+    already_loaded = [m for m in DEFERRED_MODULES if m in sys.modules]
+
+    import httpx
+    import jwt
+    from benchmarks.fakes import FakeGeminiModel, LatencyProfile
+    from app.services import gemini_service
+
+    gemini_service._gemini_service = gemini_service.GeminiService(model=FakeGeminiModel(LatencyProfile(0, 0), seed=1))
+    token = jwt.encode({"sub": "startup-user", "aud": "authenticated", "exp": int(time.time()) + 600},
+                       os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")
+
+    result = {"import_ms": import_ms, "already_loaded": already_loaded}
+    lifespan_started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        result["lifespan_ms"] = (time.perf_counter() - lifespan_started) * 1000
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30) as client:
+            request_started = time.perf_counter()
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.005)
+            result["ready_ms"] = (time.perf_counter() - lifespan_started) * 1000
+            response = await client.post(
+                "/api/roast/generate",
+                json={"spotify_access_token": "startup-spotify"},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            if response.status_code != 200:
+                raise SystemExit(f"first request failed: {response.status_code} {response.text[:200]}")
+            result["first_request_ms"] = (time.perf_counter() - request_started) * 1000
+            result["total_ms"] = (time.time() - float(os.environ["BENCH_SPAWNED_AT"])) * 1000
+
+    deferred = {}
+    for module in DEFERRED_MODULES:
+        if module in sys.modules:
+            continue
+        module_started = time.perf_counter()
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        deferred[module] = round((time.perf_counter() - module_started) * 1000, 1)
+    result["deferred_imports"] = deferred
+    print(json.dumps(result))
+
+
+def spawn(env: dict) -> dict:
+    # Wall clock, so the child can tell how long ago its interpreter was launched
+    env = {**env, "BENCH_SPAWNED_AT": repr(time.time())}
+    proc = subprocess.run(
+        [sys.executable, "-W", "ignore", "-m", "benchmarks.bench_startup", "--child"],
+        env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup run failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def import_profile(env: dict, top: int) -> list:
+    """The slowest modules by cumulative import time, from python -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in rows[:top]]
+
+
+async def run(args) -> dict:
+    from benchmarks.fakes import FakeSpotify, LatencyProfile, LocalServer
+    spotify = FakeSpotify(LatencyProfile(args.spotify_latency_ms, 0), seed=1)
+
+    async with LocalServer(spotify.app) as spotify_server:
+        env = {
+            **os.environ,
+            "SPOTIFY_API_BASE_URL": f"{spotify_server.url}/v1",
+            "SUPABASE_AUTH_MODE": "local",
+            "SUPABASE_JWT_SECRET": secrets.token_hex(32),
+            "DATABASE_URL": args.database_url or "",
+            "STARTUP_WARMUP": "true" if args.warmup else "false",
+            "LOG_LEVEL": "WARNING",
+        }
+        runs = []
+        with tempfile.TemporaryDirectory(prefix="roastmytune-bench-") as cache_dir:
+            for i in range(args.runs):
+                # A fresh shared-cache file per child: the cache outlives the process and would warm later runs
+                env = {**env, "CACHE_BACKEND": args.cache_backend, "CACHE_SQLITE_PATH": os.path.join(cache_dir, f"cache-{i}.sqlite3")}
+                # The fake must keep serving while the child runs, so block in a thread
+                runs.append(await asyncio.to_thread(spawn, env))
+            profile = await asyncio.to_thread(import_profile, env, args.top_imports) if args.top_imports else []
+
+    metrics = ("import_ms", "lifespan_ms", "ready_ms", "first_request_ms", "total_ms")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "config": vars(args),
+        },
+        "median": {m: round(statistics.median(r[m] for r in runs), 1) for m in metrics},
+        "max": {m: round(max(r[m] for r in runs), 1) for m in metrics},
+        "loaded_at_import": runs[0]["already_loaded"],
+        "deferred_imports_ms": runs[0]["deferred_imports"],
+        "slowest_imports": profile,
+        "runs": [{m: round(r[m], 1) for m in metrics} for r in runs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="start the app with STARTUP_WARMUP=true")
+    parser.add_argument("--database-url", help="also start roast persistence against this database")
+    parser.add_argument("--spotify-latency-ms", type=float, default=20)
+    parser.add_argument("--cache-backend", choices=["none", "sqlite"], default="none",
+                        help="the app's CACHE_BACKEND; sqlite uses a fresh file per run")
+    parser.add_argument("--top-imports", type=int, default=10, help="list the N slowest imports (0 = skip)")
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import time is above this")
+    parser.add_argument("--max-first-request-ms", type=float, help="fail if the median time to first request is above this")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child_main())
+        return
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    for metric, limit in (("import_ms", args.max_import_ms), ("first_request_ms", args.max_first_request_ms)):
+        if limit is not None and report["median"][metric] > limit:
+            print(f"{metric}: median {report['median'][metric]} ms is over the {limit} ms limit", file=sys.stderr)
+            failed = True
+    if report["loaded_at_import"]:
+        print(f"imported eagerly by app.main: {', '.join(report['loaded_at_import'])}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
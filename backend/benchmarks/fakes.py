@@ -0,0 +1,303 @@
+"""
+Local stand-ins for Spotify, Supabase auth and Gemini, used by the benchmarks.
+
+Each fake takes a LatencyProfile (mean latency, jitter, error rate) and records the latency
+it actually served, so benchmark output can attribute time to each upstream.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import List
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+GENRES = [
+    "pop", "dance pop", "k-pop", "indie rock", "alternative metal", "country", "southern hip hop",
+    "rap", "r&b", "classic rock", "80s synthpop", "90s alternative", "jazz", "modern classical",
+    "folk punk", "edm", "bedroom pop", "lo-fi beats", "trap", "grunge",
+]
+# Spotify serves at most this many top artists/tracks per time range
+TOP_ITEMS_TOTAL = 99
+
+
+@dataclass
+class LatencyProfile:
+    mean_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+
+    async def wait(self, rng: random.Random) -> float:
+        delay = max(0.0, rng.gauss(self.mean_ms, self.jitter_ms)) if self.jitter_ms else self.mean_ms
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        return delay
+
+    def should_fail(self, rng: random.Random) -> bool:
+        return self.error_rate > 0 and rng.random() < self.error_rate
+
+
+@dataclass
+class FakeStats:
+    """Served latency per named call, plus injected error counts and 304s answered."""
+    latencies_ms: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    not_modified: dict = field(default_factory=dict)
+
+    def record(self, name: str, ms: float, failed: bool = False):
+        self.latencies_ms.setdefault(name, []).append(ms)
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _user_rng(token: str) -> random.Random:
+    # The same Spotify token always yields the same profile
+    return random.Random(int(hashlib.sha256(token.encode()).hexdigest()[:16], 16))
+
+
+class FakeSpotify:
+    """
+    Serves the Spotify Web API endpoints SpotifyService uses, with per-user stable data.
+    With rate_limit_rps set it enforces an app-wide limit like Spotify's: requests over it
+    in the current one-second window get 429 with a Retry-After header (`retry_after` seconds).
+    With `etags` on, top-item responses carry an ETag and a matching If-None-Match gets an
+    empty 304; change_profile(token) makes that user's top items (and ETags) change.
+    """
+
+    def __init__(self, latency: LatencyProfile, seed: int = 0, rate_limit_rps: float = 0, retry_after: int = 1, etags: bool = True):
+        self.latency = latency
+        self.etags = etags
+        self._profile_versions: dict[str, int] = {}
+        self.stats = FakeStats()
+        self._rng = random.Random(seed)
+        self.rate_limit_rps = rate_limit_rps
+        self.retry_after = retry_after
+        self._window_start = 0.0
+        self._window_count = 0
+        self.app = Starlette(routes=[
+            Route("/v1/me", self.me),
+            Route("/v1/me/top/artists", self.top_artists),
+            Route("/v1/me/top/tracks", self.top_tracks),
+            Route("/v1/me/player/recently-played", self.recent),
+            Route("/v1/audio-features", self.audio_features),
+        ])
+
+    def _over_limit(self) -> bool:
+        if not self.rate_limit_rps:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start, self._window_count = now, 0
+        self._window_count += 1
+        return self._window_count > self.rate_limit_rps
+
+    def change_profile(self, token: str):
+        self._profile_versions[token] = self._profile_versions.get(token, 0) + 1
+
+    async def _serve(self, name: str, request: Request, body_fn, etag: bool = False):
+        if self._over_limit():
+            self.stats.errors[f"{name}.throttled"] = self.stats.errors.get(f"{name}.throttled", 0) + 1
+            return JSONResponse({"error": {"status": 429, "message": "API rate limit exceeded"}},
+                                status_code=429, headers={"Retry-After": str(self.retry_after)})
+        started = time.perf_counter()
+        await self.latency.wait(self._rng)
+        failed = self.latency.should_fail(self._rng)
+        self.stats.record(name, (time.perf_counter() - started) * 1000, failed)
+        if failed:
+            headers = {"Retry-After": str(self.retry_after)} if self.latency.error_status == 429 else None
+            return JSONResponse({"error": {"status": self.latency.error_status}}, status_code=self.latency.error_status, headers=headers)
+        response = JSONResponse(body_fn())
+        if etag and self.etags:
+            tag = '"' + hashlib.sha256(response.body).hexdigest()[:20] + '"'
+            if request.headers.get("if-none-match") == tag:
+                self.stats.not_modified[name] = self.stats.not_modified.get(name, 0) + 1
+                return Response(status_code=304, headers={"ETag": tag})
+            response.headers["ETag"] = tag
+        return response
+
+    @staticmethod
+    def _token(request: Request) -> str:
+        return request.headers.get("authorization", "").removeprefix("Bearer ")
+
+    @staticmethod
+    def _artist(artist_id: str, rng: random.Random) -> dict:
+        return {
+            "id": artist_id, "name": f"Artist {artist_id}", "genres": rng.sample(GENRES, rng.randint(0, 4)),
+            "popularity": rng.randint(5, 100), "images": [{"url": f"https://img.invalid/{artist_id}"}],
+        }
+
+    @staticmethod
+    def _track(track_id: str, rng: random.Random) -> dict:
+        return {
+            "id": track_id, "name": f"Track {track_id}", "popularity": rng.randint(0, 100),
+            "artists": [{"name": f"Artist {rng.randint(0, 500)}"}],
+            "album": {"name": f"Album {rng.randint(0, 500)}", "images": []},
+        }
+
+    def _top_page(self, request: Request, make_item) -> dict:
+        """
+        One page of a user's deterministic top-item list for the requested time range, so
+        overlapping pages agree. Like Spotify, at most TOP_ITEMS_TOTAL items exist per range.
+        """
+        limit = int(request.query_params.get("limit", 20))
+        offset = int(request.query_params.get("offset", 0))
+        time_range = request.query_params.get("time_range", "medium_term")
+        token = self._token(request)
+        seed = token + request.url.path + ("" if time_range == "medium_term" else time_range)
+        if self._profile_versions.get(token):
+            seed += f"#{self._profile_versions[token]}"
+        rng = _user_rng(seed)
+        items = [make_item(rng) for _ in range(min(offset + limit, TOP_ITEMS_TOTAL))]
+        return {"items": items[offset:], "total": TOP_ITEMS_TOTAL, "offset": offset, "limit": limit}
+
+    async def me(self, request: Request):
+        user_id = "user-" + hashlib.sha256(self._token(request).encode()).hexdigest()[:16]
+        return await self._serve("me", request, lambda: {"id": user_id, "display_name": user_id})
+
+    async def top_artists(self, request: Request):
+        # Draw from a shared pool so popular artists overlap across users
+        return await self._serve("top_artists", request, lambda: self._top_page(
+            request, lambda rng: self._artist(f"a{rng.randint(0, 2000)}", rng)), etag=True)
+
+    async def top_tracks(self, request: Request):
+        return await self._serve("top_tracks", request, lambda: self._top_page(
+            request, lambda rng: self._track(f"t{rng.randint(0, 5000)}", rng)), etag=True)
+
+    async def recent(self, request: Request):
+        limit = int(request.query_params.get("limit", 20))
+        def body():
+            rng = _user_rng(self._token(request) + request.url.path)
+            return {"items": [{"track": self._track(f"t{rng.randint(0, 5000)}", rng)} for _ in range(limit)]}
+        return await self._serve("recently_played", request, body)
+
+    async def audio_features(self, request: Request):
+        ids = request.query_params.get("ids", "").split(",")
+        def body():
+            features = []
+            for track_id in ids:
+                rng = _user_rng(track_id)
+                features.append({
+                    "id": track_id, "danceability": rng.random(), "energy": rng.random(),
+                    "valence": rng.random(), "tempo": rng.uniform(60, 180),
+                })
+            return {"audio_features": features}
+        return await self._serve("audio_features", request, body)
+
+
+class FakeSupabaseAuth:
+    """Answers GET /auth/v1/user like Supabase does for a valid access token."""
+
+    def __init__(self, latency: LatencyProfile, seed: int = 0):
+        self.latency = latency
+        self.stats = FakeStats()
+        self._rng = random.Random(seed)
+        self.app = Starlette(routes=[Route("/auth/v1/user", self.user)])
+
+    async def user(self, request: Request):
+        started = time.perf_counter()
+        await self.latency.wait(self._rng)
+        failed = self.latency.should_fail(self._rng)
+        self.stats.record("get_user", (time.perf_counter() - started) * 1000, failed)
+        if failed:
+            return JSONResponse({"msg": "injected failure"}, status_code=self.latency.error_status)
+        token = request.headers.get("authorization", "").removeprefix("Bearer ")
+        user_id = hashlib.sha256(token.encode()).hexdigest()[:32]
+        return JSONResponse({
+            "id": user_id, "aud": "authenticated", "role": "authenticated", "email": f"{user_id[:8]}@bench.invalid",
+            "app_metadata": {}, "user_metadata": {}, "created_at": "2024-01-01T00:00:00Z",
+        })
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeStream:
+    def __init__(self, chunks: List[str], chunk_delay_s: float):
+        self._chunks = chunks
+        self._delay = chunk_delay_s
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield _FakeResponse(chunk)
+
+
+class FakeGeminiModel:
+    """Drop-in for genai.GenerativeModel's async API: returns a canned roast after a delay."""
+
+    def __init__(self, latency: LatencyProfile, seed: int = 0, stream_chunks: int = 20):
+        self.latency = latency
+        self.stats = FakeStats()
+        self._rng = random.Random(seed)
+        self.stream_chunks = stream_chunks
+
+    def _payload(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:6]
+        roast = {
+            "roast": f"Benchmark roast {digest}: your taste is statistically significant and spiritually empty.",
+            "persona": f"Synthetic Listener {digest}",
+            "era": {"title": "2016 Benchmark Era", "description": "Stuck in a load test."},
+            "hogwarts_house": {"house": "Hufflepuff", "reason": "Loyal to the same five artists."},
+        }
+        if '"members"' not in prompt:
+            return json.dumps(roast)
+        # Packed group prompt: one roast per member id, plus the group roast if asked for
+        payload = {"members": [{"id": pack_id, **roast} for pack_id in re.findall(r"^\s*\[(m\d+)\]$", prompt, re.M)]}
+        if re.search(r"^GROUP:", prompt, re.M):
+            payload["group"] = {"title": f"Benchmark Group {digest}", "roast": "Collectively, a rounding error."}
+        return json.dumps(payload)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        started = time.perf_counter()
+        failed = self.latency.should_fail(self._rng)
+        if stream:
+            delay = max(0.0, self._rng.gauss(self.latency.mean_ms, self.latency.jitter_ms)) if self.latency.jitter_ms else self.latency.mean_ms
+            self.stats.record("generate_stream", delay, failed)
+            if failed:
+                raise RuntimeError("injected Gemini failure")
+            text = self._payload(prompt)
+            size = max(1, len(text) // self.stream_chunks)
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            return _FakeStream(chunks, delay / 1000 / len(chunks))
+        await self.latency.wait(self._rng)
+        self.stats.record("generate", (time.perf_counter() - started) * 1000, failed)
+        if failed:
+            raise RuntimeError("injected Gemini failure")
+        return _FakeResponse(self._payload(prompt))
+
+
+class LocalServer:
+    """Runs an ASGI app with uvicorn on a free localhost port inside the current event loop."""
+
+    def __init__(self, app):
+        self.app = app
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False, lifespan="off"))
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._server.serve(sockets=[self.sock]))
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.should_exit = True
+        await self._task